@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# Keep stdout pure JSON
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from game.game import Game
+from game.levels import create_levels, levels_file
+from game.leveleditor import LevelEditor
+from game.scheduler import DEFAULT_FPS
+from game.persistence import MemoryStorage
+from game.simulation import Board, DIRECTIONS, ACTIONS
+from game.batch import BatchStepper, numpy
+
+DIRECTION_NAMES = ("up", "down", "left", "right")
+DEFAULT_REPEAT = 50
+DEFAULT_TOLERANCE = 0.10
+# Rows of the batch stepper benchmark, spread over all levels
+BATCH_ROWS = 10_000
+# What a cold start of main.py does before its first frame, on the levels file filled in
+STARTUP = "from game.game import Game; Game(levels_path={!r}).screen.display_menu()"
+# Files next to the levels that are copied along, so the benchmark sees the same index the game does
+LEVEL_FILES = ("levels.json", "levels.json.metrics")
+
+def summarize(samples):
+    # Sample times in seconds, reported in microseconds with nearest-rank percentiles
+    samples = sorted(samples)
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1e6, 1)
+    return {
+        "count": len(samples),
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "min_us": round(samples[0] * 1e6, 1),
+        "p50_us": percentile(50),
+        "p90_us": percentile(90),
+        "p99_us": percentile(99),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+def bench_moves(game, repeat):
+    # Game.move_player is Player.move plus the entity sync, one direction at a time from the level start
+    results = {}
+    for index in range(len(game.levels)):
+        game.load_level(index)
+        for direction in DIRECTIONS:
+            samples = []
+            for _ in range(repeat):
+                game.reset_level()
+                samples.append(timed(game.move_player, direction))
+            results[f"move/level-{index + 1}/{DIRECTION_NAMES[direction]}"] = summarize(samples)
+    return results
+
+def bench_undo(game, repeat):
+    async def run():
+        rnd = random.Random(1)
+        samples = []
+        for index in range(len(game.levels)):
+            game.load_level(index)
+            for _ in range(repeat):
+                game.reset_level()
+                for _ in range(rnd.randint(1, 20)):
+                    game.move_player(rnd.choice(DIRECTIONS))
+                # A refused undo shakes for a fixed time, only undos that go through are measured
+                if game.simulation.can_undo():
+                    start = time.perf_counter()
+                    await game.undo_last_action()
+                    samples.append(time.perf_counter() - start)
+        return samples
+    return {"undo": summarize(asyncio.run(run()))}
+
+def bench_teleports(game, repeat):
+    # Random walks with undos on the levels that have teleports
+    rnd = random.Random(2)
+    samples = []
+    for index in range(len(game.levels)):
+        if not game.levels.data(index).get("teleports"):
+            continue
+        game.load_level(index)
+        for _ in range(repeat):
+            game.reset_level()
+            for _ in range(40):
+                if rnd.random() < 0.25 and game.simulation.can_undo():
+                    samples.append(timed(game.simulation.undo))
+                    game.sync_entities()
+                else:
+                    samples.append(timed(game.move_player, rnd.choice(DIRECTIONS)))
+    return {"teleport/steps": summarize(samples)} if samples else {}
+
+def bench_load_level(game, repeat):
+    samples = []
+    for _ in range(repeat):
+        for index in range(len(game.levels)):
+            samples.append(timed(game.load_level, index))
+    return {"load_level": summarize(samples)}
+
+def bench_create_levels(game, repeat):
+    return {"create_levels": summarize([timed(create_levels, game.levels_path) for _ in range(repeat)])}
+
+def bench_frames(game, repeat):
+    idle, moved = [], []
+    rnd = random.Random(3)
+    for index in range(len(game.levels)):
+        game.load_level(index)
+        draw = (game.screen.update_screen, game.player, game.key, game.door, game.dynamic_blocks, index + 1, len(game.levels))
+        draw[0](*draw[1:])
+        for _ in range(repeat):
+            idle.append(timed(*draw))
+            game.move_player(rnd.choice(DIRECTIONS))
+            moved.append(timed(*draw))
+    return {"frame/idle": summarize(idle), "frame/move": summarize(moved)}
+
+def bench_editor(game, repeat):
+    samples = []
+    for index in range(len(game.levels)):
+        editor = LevelEditor(game.screen, level_index=index, levels=game.levels)
+        for _ in range(repeat):
+            samples.append(timed(editor.draw_elements))
+    game.screen.invalidate()
+    return {"editor/draw_elements": summarize(samples)}
+
+def bench_startup(game, repeat):
+    # Fresh interpreters, so imports, pygame init, font and texture loading are all cold
+    command = [sys.executable, "-c", STARTUP.format(game.levels_path)]
+    root = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(max(repeat // 10, 3)):
+        samples.append(timed(subprocess.run, command, cwd=root, check=True, capture_output=True))
+    return {"startup": summarize(samples)}
+
+def bench_batch(game, repeat):
+    # One BatchStepper.step over BATCH_ROWS random walks with undos, skipped without NumPy
+    if numpy is None:
+        return {}
+    boards = [Board.from_level_data(game.levels.data(index)) for index in range(len(game.levels))]
+    stepper = BatchStepper(boards)
+    state = stepper.reset([row % len(boards) for row in range(BATCH_ROWS)])
+    rnd = random.Random(4)
+    samples = []
+    for _ in range(repeat):
+        actions = numpy.array([rnd.choice(ACTIONS) for _ in range(BATCH_ROWS)])
+        samples.append(timed(stepper.step, state, actions, True))
+        stepper.reset_rows(state, state.won)
+    return {f"batch/step-{BATCH_ROWS}": summarize(samples)}
+
+def copy_levels(directory):
+    # The game renders thumbnails and compacts saves next to its levels file, so the benchmark plays a copy
+    source = os.path.dirname(levels_file("../data/levels.json"))
+    for name in LEVEL_FILES:
+        if os.path.exists(os.path.join(source, name)):
+            shutil.copy(os.path.join(source, name), directory)
+    return os.path.join(directory, LEVEL_FILES[0])
+
+def measure_idle(seconds, fps, levels_path):
+    # Run the real main loop on level 1 with no input and report how much CPU it burns. The thumbnail
+    # worker the loop starts is run to the end first, so it is not counted as idle CPU.
+    game = Game(fps=fps, levels_path=levels_path, storage=MemoryStorage())
+    game.update_thumbnails()
+    game.thumbnails.wait()
+    game.start_game(0)
+    quit_timer = threading.Timer(seconds, pygame.event.post, [pygame.event.Event(pygame.QUIT)])
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    quit_timer.start()
+    asyncio.run(game.run())
+    wall = time.perf_counter() - start_wall
+    cpu = time.process_time() - start_cpu
+    return {
+        "benchmark": "idle",
+        "fps": fps,
+        "seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "idle_cpu_percent": round(100 * cpu / wall, 2),
+        "frames": game.scheduler.frames,
+        "idle_frames": game.scheduler.idle_frames,
+    }
+
+BENCHMARKS = {
+    "moves": bench_moves,
+    "undo": bench_undo,
+    "teleports": bench_teleports,
+    "load_level": bench_load_level,
+    "create_levels": bench_create_levels,
+    "frames": bench_frames,
+    "editor": bench_editor,
+    "startup": bench_startup,
+    "batch": bench_batch,
+}
+
+def compare(results, baseline, tolerance):
+    # Median against median, and idle CPU against idle CPU; anything slower by more than the tolerance regresses
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        metric = "p50_us" if "p50_us" in result else "idle_cpu_percent"
+        before, after = baseline[name][metric], result[metric]
+        ratio = after / before if before else None
+        rows.append({
+            "benchmark": name,
+            "metric": metric,
+            "baseline": before,
+            "current": after,
+            "ratio": round(ratio, 3) if ratio is not None else None,
+            "regressed": ratio is not None and ratio > 1 + tolerance,
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game's hot paths under the dummy video driver")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS) + ["idle"],
+                        help="run just this benchmark, can be repeated")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="samples per measured case")
+    parser.add_argument("--seconds", type=float, default=3.0, help="length of the idle loop measurement")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS)
+    parser.add_argument("--output", help="also write the results to this file, to use as a baseline later")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown that counts as a regression, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    pygame.init()
+    names = args.only or list(BENCHMARKS) + ["idle"]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        levels_path = copy_levels(directory)
+        game = Game(fps=args.fps, levels_path=levels_path, storage=MemoryStorage())
+        for name in names:
+            if name in BENCHMARKS:
+                results.update(BENCHMARKS[name](game, args.repeat))
+        if "idle" in names:
+            results["idle"] = measure_idle(args.seconds, args.fps, levels_path)
+
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    regressed = False
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)["results"]
+        report["comparison"] = compare(results, baseline, args.tolerance)
+        regressed = any(row["regressed"] for row in report["comparison"])
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
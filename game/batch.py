@@ -0,0 +1,262 @@
+from array import array
+from game.simulation import Simulation, UNDO, PLAYER, KEY, DOOR, KEY_REMOVED
+
+try:
+    import numpy
+except ImportError:
+    # Only the batch stepper needs NumPy, the game and the other tools run without it
+    numpy = None
+
+# Undo entries kept per object before the history buffer doubles
+HISTORY_CAPACITY = 64
+
+
+class BatchState:
+    # Many game states side by side, one row each, as arrays over the rows. Every row plays one of the
+    # stepper's boards. Blocks that can never move are part of the board and not stored; blocks[row, j]
+    # is the j-th block of the board that can, as listed in BatchStepper.mobile. history[row, slot] is an
+    # undo stack bottom first, for the player, key, door and then those blocks, and depth[row, slot] is
+    # how much of it is in use.
+    def __init__(self, level, player, key, door, door_open, blocks, history, depth):
+        self.level = level
+        self.player = player
+        self.key = key
+        self.door = door
+        self.door_open = door_open
+        self.blocks = blocks
+        self.history = history
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.level)
+
+    @property
+    def won(self):
+        return self.door_open & (self.player == self.door)
+
+    def copy(self):
+        return BatchState(self.level.copy(), self.player.copy(), self.key.copy(), self.door.copy(),
+                          self.door_open.copy(), self.blocks.copy(), self.history.copy(), self.depth.copy())
+
+
+class BatchStepper:
+    # Advances every row of a BatchState by one action in a single call, under the same rules as
+    # Simulation.step. Moves and undos that touch no teleport pad and no stacked blocks, which is
+    # nearly all of them, run as array operations over the rows. The rest, where teleports chain
+    # jumps and pushes, go through a Simulation one row at a time, so both always agree.
+    def __init__(self, boards):
+        if numpy is None:
+            raise RuntimeError("The batch stepper needs NumPy (pip install numpy)")
+        self.boards = list(boards)
+        if len({board.grid_size for board in self.boards}) != 1:
+            raise ValueError("All boards of a batch need the same grid size")
+        first = self.boards[0]
+        levels = len(self.boards)
+        self.deltas = numpy.array(first.deltas + (0,), dtype=numpy.int32)
+        # Cell tables keep the padding row of Board, a cell one step off the board reads as outside
+        self.interior = numpy.frombuffer(first.interior, dtype=numpy.uint8).astype(bool)
+        self.pads = numpy.array([numpy.frombuffer(board.pads, dtype=numpy.uint8) for board in self.boards]).astype(bool)
+        self.has_teleports = numpy.array([bool(board.teleports) for board in self.boards])
+        # Movable blocks and blocks on teleport pads can move, the others only ever count towards their cell
+        mobile = [[i for i, cell in enumerate(board.block_starts) if board.movable[i] or board.pads[cell]]
+                  for board in self.boards]
+        width = max(map(len, mobile), default=0)
+        self.slots = 3 + width
+        self.mobile = numpy.full((levels, width), -1, dtype=numpy.int32)
+        self.movable = numpy.zeros((levels, width), dtype=bool)
+        self.block_starts = numpy.zeros((levels, width), dtype=numpy.int32)
+        self.fixed = numpy.zeros((levels, len(first.interior)), dtype=numpy.int32)
+        for level, (board, blocks) in enumerate(zip(self.boards, mobile)):
+            self.mobile[level, :len(blocks)] = blocks
+            self.movable[level, :len(blocks)] = [board.movable[i] for i in blocks]
+            self.block_starts[level, :len(blocks)] = [board.block_starts[i] for i in blocks]
+            for i, cell in enumerate(board.block_starts):
+                if i not in blocks:
+                    self.fixed[level, cell] += 1
+        self.present = self.mobile >= 0
+        # Undo refuses to stack blocks and to leave any outside, fixed ones included
+        self.fixed_blocked = (self.fixed > 1).any(axis=1) | (self.fixed.astype(bool) & ~self.interior).any(axis=1)
+        self.simulations = {}
+
+    def reset(self, levels):
+        # A new batch with one row per entry of levels, each at the start of that board
+        level = numpy.asarray(levels, dtype=numpy.int32)
+        rows = len(level)
+        return BatchState(
+            level,
+            numpy.array([self.boards[i].player_start for i in level], dtype=numpy.int32),
+            numpy.array([self.boards[i].key_start for i in level], dtype=numpy.int32),
+            numpy.array([self.boards[i].door_start for i in level], dtype=numpy.int32),
+            numpy.zeros(rows, dtype=bool),
+            self.block_starts[level].copy(),
+            numpy.zeros((rows, self.slots, HISTORY_CAPACITY), dtype=numpy.int16),
+            numpy.zeros((rows, self.slots), dtype=numpy.int32),
+        )
+
+    def reset_rows(self, state, rows):
+        # Puts the given rows (indices or a mask) back at the start of their boards, in place
+        level = state.level[rows]
+        boards = self.boards
+        state.player[rows] = [boards[i].player_start for i in level]
+        state.key[rows] = [boards[i].key_start for i in level]
+        state.door[rows] = [boards[i].door_start for i in level]
+        state.door_open[rows] = False
+        state.blocks[rows] = self.block_starts[level]
+        state.depth[rows] = 0
+
+    def step(self, state, actions, in_place=False):
+        # One action per row (UP, DOWN, LEFT, RIGHT or UNDO). Returns the new state, which rows are won
+        # and which actions were refused, like a False from Simulation.step.
+        if not in_place:
+            state = state.copy()
+        actions = numpy.asarray(actions)
+        invalid = numpy.ones(len(state), dtype=bool)
+        rows = numpy.flatnonzero(actions != UNDO)
+        slow = [self._move(state, rows, self.deltas[actions[rows]], invalid)]
+        rows = numpy.flatnonzero(actions == UNDO)
+        slow.append(self._undo(state, rows, invalid))
+        for row in numpy.concatenate(slow):
+            invalid[row] = not self._step_row(state, row, int(actions[row]))
+        return state, state.won, invalid
+
+    def _move(self, state, rows, d, invalid):
+        interior = self.interior
+        level = state.level[rows]
+        player, key, door, door_open = state.player[rows], state.key[rows], state.door[rows], state.door_open[rows]
+        blocks = state.blocks[rows]
+        present = self.present[level]
+        new = player + d
+        target = new + d
+        enter = interior[new] | (door_open & (new == door))
+        at_new = (blocks == new[:, None]) & present
+        fixed_new = self.fixed[level, new]
+        count_new = fixed_new + at_new.sum(axis=1)
+        count_target = self.fixed[level, target] + ((blocks == target[:, None]) & present).sum(axis=1)
+        on_key = key == new
+        on_door = ~door_open & (door == new)
+        # Teleports, stacked blocks and cells shared by several objects take the exact path
+        slow = enter & ((self.has_teleports[level] & (self.pads[level, new] | self.pads[level, target])) |
+                        (count_new > 1) | ((count_new > 0) & (on_key | on_door)) | (on_key & on_door))
+        free = interior[target] | (door_open & (target == door))
+        block = at_new.argmax(axis=1)
+        push_block = count_new == 1
+        block_ok = (fixed_new == 0) & self.movable[level, block] & free & \
+            (target != key) & (target != door) & (count_target == 0)
+        key_ok = (free & (count_target == 0)) | (target == door)
+        door_ok = interior[target] & (count_target == 0)
+        moved = enter & ~slow & (~push_block | block_ok) & (~on_key | key_ok) & (~on_door | door_ok)
+
+        for mask, slot in ((push_block, 3 + block), (on_key, KEY), (on_door, DOOR), (True, PLAYER)):
+            pushed = moved & mask
+            if not pushed.any():
+                continue
+            changed = rows[pushed]
+            if isinstance(slot, numpy.ndarray):
+                slot = slot[pushed]
+                state.blocks[changed, slot - 3] = target[pushed]
+            elif slot == KEY:
+                state.key[changed] = target[pushed]
+            elif slot == DOOR:
+                state.door[changed] = target[pushed]
+            else:
+                state.player[changed] = new[pushed]
+            self._push(state, changed, slot, d[pushed])
+        self._settle(state, rows[moved])
+        invalid[rows[moved]] = False
+        return rows[slow]
+
+    def _undo(self, state, rows, invalid):
+        interior = self.interior
+        level = state.level[rows]
+        present = self.present[level]
+        depth = state.depth[rows]
+        # Stack tops read in place, the history buffer itself is never copied
+        top = state.history[rows[:, None], numpy.arange(self.slots), numpy.maximum(depth - 1, 0)]
+        top = numpy.where(depth > 0, top, 0)
+        player = state.player[rows] - top[:, PLAYER]
+        key = state.key[rows] - top[:, KEY]
+        door = state.door[rows] - top[:, DOOR]
+        # Padding slots get cells of their own that match nothing
+        blocks = numpy.where(present, state.blocks[rows] - top[:, 3:], -2 - numpy.arange(self.slots - 3))
+        cells = numpy.maximum(blocks, 0)
+        active = state.key[rows] != KEY_REMOVED
+        pads = self.pads[level[:, None], numpy.stack([player, key, door], axis=1)].any(axis=1) | \
+            (self.pads[level[:, None], cells] & present).any(axis=1)
+        slow = active & self.has_teleports[level] & pads
+        ordered = numpy.sort(blocks, axis=1)
+        stacked = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1) | \
+            (self.fixed[level[:, None], cells].astype(bool) & present).any(axis=1)
+
+        def occupied(cell):
+            return self.fixed[level, cell].astype(bool) | (blocks == cell[:, None]).any(axis=1)
+
+        ok = active & ~slow & ~self.fixed_blocked[level] & ~stacked & \
+            interior[player] & interior[key] & interior[door] & (interior[cells] | ~present).all(axis=1) & \
+            (player != key) & (player != door) & ~occupied(player) & ~occupied(key) & ~occupied(door)
+
+        undone = rows[ok]
+        state.player[undone] = player[ok]
+        state.key[undone] = key[ok]
+        state.door[undone] = door[ok]
+        state.blocks[undone] = numpy.where(present[ok], blocks[ok], state.blocks[undone])
+        state.depth[undone] = numpy.maximum(depth[ok] - 1, 0)
+        self._settle(state, undone)
+        invalid[undone] = False
+        return rows[slow]
+
+    def _reserve(self, state, length):
+        capacity = state.history.shape[2]
+        if length > capacity:
+            while length > capacity:
+                capacity *= 2
+            grown = numpy.zeros(state.history.shape[:2] + (capacity,), dtype=numpy.int16)
+            grown[:, :, :state.history.shape[2]] = state.history
+            state.history = grown
+
+    def _push(self, state, rows, slot, d):
+        depth = state.depth[rows, slot]
+        self._reserve(state, depth.max(initial=0) + 1)
+        state.history[rows, slot, depth] = d
+        state.depth[rows, slot] = depth + 1
+
+    def _settle(self, state, rows):
+        opened = rows[state.key[rows] == state.door[rows]]
+        state.door_open[opened] = True
+        state.key[opened] = KEY_REMOVED
+
+    def objects(self, level):
+        # Simulation object of every history slot of a board
+        return (PLAYER, KEY, DOOR) + tuple(3 + int(i) for i in self.mobile[level] if i >= 0)
+
+    def simulation(self, state, row):
+        # The row as a Simulation of its board, one kept per board and reused
+        level = int(state.level[row])
+        board = self.boards[level]
+        simulation = self.simulations.get(level)
+        if simulation is None:
+            simulation = self.simulations[level] = Simulation(board)
+        blocks = list(board.block_starts)
+        history = [array('h') for _ in range(3 + len(blocks))]
+        for slot, obj in enumerate(self.objects(level)):
+            if obj >= 3:
+                blocks[obj - 3] = int(state.blocks[row, slot - 3])
+            history[obj].frombytes(state.history[row, slot, :state.depth[row, slot]].tobytes())
+        simulation.restore((int(state.player[row]), int(state.key[row]), int(state.door[row]),
+                            bool(state.door_open[row]), tuple(blocks), history))
+        return simulation
+
+    def _step_row(self, state, row, action):
+        simulation = self.simulation(state, row)
+        stepped = simulation.step(action)
+        state.player[row] = simulation.player
+        state.key[row] = simulation.key
+        state.door[row] = simulation.door
+        state.door_open[row] = simulation.door_open
+        history = simulation.history
+        self._reserve(state, max(map(len, history)))
+        for slot, obj in enumerate(self.objects(int(state.level[row]))):
+            if obj >= 3:
+                state.blocks[row, slot - 3] = simulation.blocks[obj - 3]
+            state.history[row, slot, :len(history[obj])] = history[obj]
+            state.depth[row, slot] = len(history[obj])
+        return stepped
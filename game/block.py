@@ -1,9 +1,9 @@
 import pygame
 import asyncio
+from game.textures import load_texture
 
 class Block:
     def __init__(self, x, y, width, height, can_move=False, image_path="assets/pixel_block.png", image_path_moveable="assets/pixel_block_moveable.png"):
-        self.movements = []
         self.rect = pygame.Rect(x, y, width, height)
         self.can_move = can_move
         self.image_path = image_path
@@ -12,10 +12,9 @@ class Block:
 
     def load_image(self):
         if self.can_move:
-            self.image = pygame.image.load(self.image_path_moveable)
+            self.image = load_texture(self.image_path_moveable, self.rect.size)
         else:
-            self.image = pygame.image.load(self.image_path)
-        self.image = pygame.transform.scale(self.image, (self.rect.width, self.rect.height))
+            self.image = load_texture(self.image_path, self.rect.size)
 
     def draw(self, screen):
         screen.blit(self.image, self.rect.topleft)
@@ -31,23 +30,6 @@ class Block:
     def is_moveable(self):
         return self.can_move
 
-    def record_movement(self, direction):
-        self.movements.append(direction)
-
-    def move(self, dx, dy):
-        self.rect.x += dx
-        self.rect.y += dy
-        self.record_movement((dx, dy))
-
-    def undo_movement(self):
-        if self.movements:
-            dx, dy = self.movements.pop()
-            self.rect.x -= dx
-            self.rect.y -= dy
-            return -dx, -dy
-        else:
-            return 0, 0
-
     async def shake(self, screen):
         original_position = self.rect.topleft
         shake_distance = 5
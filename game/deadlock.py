@@ -0,0 +1,283 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from array import array
+from itertools import product
+from collections import deque
+from game.levels import levels_file, load_levels_data
+from game.simulation import Board, Simulation, DIRECTIONS, PLAYER, KEY, DOOR, KEY_REMOVED
+from game.transposition import TranspositionTable
+from game.zobrist import ZobristKeys
+
+logger = logging.getLogger(__name__)
+
+DEAD, UNKNOWN = "dead", "unknown"
+# Verdict cache value of positions a way to the door was found from
+OPEN = "open"
+# Undo stack entries a search tells apart, deeper ones can be anything
+KNOWN_DEPTH = 2
+# Positions one search may visit before it gives up without a verdict
+MAX_STATES = 5_000
+# Undos whose outcome depends on more forgotten stack entries than this end the search without a verdict
+MAX_UNKNOWN = 3
+# Proven positions kept between searches of a level: 2**CACHE_BITS table slots, positions hashed to
+# the same slot replace each other
+CACHE_BITS = 18
+# Expansions between deadline checks
+CHUNK = 16
+# Marks forgotten entries at the bottom of a stack; never read, a stack whose known part is used up
+# gets a concrete top before every undo
+FORGOTTEN = 0
+
+
+class DeadStateChecker:
+    # Tells when a level can no longer be won, not even with undo. Cheap static patterns are checked
+    # straight after every input; anything else gets a bounded breadth-first search that the game loop
+    # advances in time slices, so input handling never waits for it.
+    #
+    # Undo stacks grow without bound, so the search runs over positions plus the top KNOWN_DEPTH entries
+    # of each stack. An undo that reaches past them tries every delta, and 0, which undoes like an empty
+    # stack. That covers everything the real stacks can do, so running out of positions proves the level
+    # lost. Reaching the door proves nothing and leaves the verdict unknown. Every position of a search
+    # that ran out is lost as well and every position on a way to the door is worth no search, and both
+    # are kept for the rest of the level, by the Zobrist hash of the position in a transposition table
+    # of fixed size. The bigger the search that proved a verdict, the longer it keeps its slot.
+    def __init__(self, enabled=False, max_states=MAX_STATES, known_depth=KNOWN_DEPTH):
+        self.enabled = enabled
+        self.max_states = max_states
+        self.known_depth = known_depth
+        self.proven = TranspositionTable(CACHE_BITS)
+        self.board = None
+        self.search = None
+        self.verdict = UNKNOWN
+
+    def start_level(self, board):
+        self.board = board
+        self.simulation = Simulation(board)
+        self.objects = 3 + len(board.block_starts)
+        # Where objects come out of the teleports
+        self.exits = {pad + d for pair in board.teleports for pad in pair for d in board.deltas}
+        # Immovable blocks off the teleport pads never move and never get an undo entry
+        solid = bytearray(1 - inside for inside in board.interior)
+        for i, cell in enumerate(board.block_starts):
+            if not board.movable[i] and not board.pads[cell]:
+                solid[cell] = 1
+        # Pads, wall ones too, and the cells objects come out on never count as solid: a player coming
+        # out of a pad can push what lies ahead
+        for cell in self.exits:
+            if 0 <= cell < len(solid):
+                solid[cell] = 0
+        for cell, pad in enumerate(board.pads):
+            if pad:
+                solid[cell] = 0
+        # Cells nothing can ever enter or push from: walls and those blocks
+        self.solid = bytes(solid)
+        self.tracked = (PLAYER, KEY, DOOR) + tuple(
+            3 + i for i, cell in enumerate(board.block_starts) if board.movable[i] or board.pads[cell])
+        self.undo_deltas = (0,) + board.deltas
+        self.zobrist = ZobristKeys(board, stack_depth=self.known_depth)
+        self.proven.clear()
+        self.search = None
+        self.verdict = UNKNOWN
+
+    @property
+    def searching(self):
+        return self.search is not None
+
+    def state(self, simulation):
+        # Positions plus, for every object that can move, its known stack top and whether more lies below.
+        # Once the door is open undo is gone for good and the stacks stop mattering.
+        position = (simulation.player, simulation.key, simulation.door, simulation.door_open, tuple(simulation.blocks))
+        if simulation.key == KEY_REMOVED:
+            return position + (None,)
+        tops = []
+        for obj in self.tracked:
+            stack = simulation.history[obj]
+            forgotten = bool(stack) and stack[0] == FORGOTTEN
+            known = stack[forgotten:]
+            if len(known) > self.known_depth:
+                known = known[len(known) - self.known_depth:]
+                forgotten = True
+            tops.append((tuple(known), forgotten))
+        return position + (tuple(tops),)
+
+    def state_hash(self, state):
+        player, key, door, door_open, blocks, tops = state
+        zobrist = self.zobrist
+        h = zobrist.door_open if door_open else 0
+        h ^= zobrist.position(PLAYER, player) ^ zobrist.position(KEY, key) ^ zobrist.position(DOOR, door)
+        for obj in self.tracked[3:]:
+            h ^= zobrist.position(obj, blocks[obj - 3])
+        if tops is None:
+            return h
+        for obj, (stack, forgotten) in zip(self.tracked, tops):
+            h ^= zobrist.stack(obj, stack, forgotten)
+        # Stacks that still count, told apart from the same position after the door opened
+        return ~h & 0xFFFFFFFFFFFFFFFF
+
+    def restore(self, state, tops=None):
+        player, key, door, door_open, blocks, known = state
+        history = [array('h') for _ in range(self.objects)]
+        for obj, (stack, forgotten) in zip(self.tracked, known or ()):
+            if forgotten:
+                history[obj].append(FORGOTTEN)
+            history[obj].extend(stack)
+        for obj, d in (tops or {}).items():
+            history[obj].append(d)
+        self.simulation.restore((player, key, door, door_open, blocks, history))
+
+    def update(self, simulation):
+        # After every input: a verdict straight away when one is known, a new search otherwise
+        if not self.enabled or self.board is None:
+            return self.verdict
+        state = self.state(simulation)
+        h = self.state_hash(state)
+        proven = self.proven.get(h)
+        self.search = None
+        if proven == DEAD or self.static_dead(state):
+            self.verdict = DEAD
+        else:
+            self.verdict = UNKNOWN
+            if proven != OPEN and not simulation.won:
+                self.search = self.run_search(state, h)
+        return self.verdict
+
+    def advance(self, seconds):
+        # Runs the pending search for about this long, returns True when it finished
+        if self.search is None:
+            return False
+        deadline = time.perf_counter() + seconds
+        for _ in self.search:
+            if time.perf_counter() >= deadline:
+                return False
+        self.search = None
+        return True
+
+    def frozen(self, cell):
+        # Nothing can push it along either axis and it sits on no pad that would throw it elsewhere
+        solid = self.solid
+        width = self.board.width
+        return not self.board.pads[cell] and \
+            (solid[cell - width] or solid[cell + width]) and (solid[cell - 1] or solid[cell + 1])
+
+    def static_dead(self, state):
+        player, key, door, door_open, blocks, tops = state
+        solid = self.solid
+        if door_open:
+            # The player has to step onto the door from a neighbour or come out of a teleport onto it
+            return door not in self.exits and all(solid[door + d] for d in self.board.deltas)
+        # Without undo entries a frozen object stays where it is
+        if tops[KEY] != ((), False) or not self.frozen(key):
+            return False
+        if tops[DOOR] != ((), False):
+            return False
+        if self.frozen(door):
+            return True
+        # The door has to be pushed onto the key from a free neighbour with the player behind it, or be
+        # thrown onto it by a teleport. Undo only takes it back over cells it is pushed through from now on.
+        return key not in self.exits and all(solid[key - d] or solid[key - 2 * d] for d in self.board.deltas)
+
+    def children(self, state):
+        simulation = self.simulation
+        for direction in DIRECTIONS:
+            self.restore(state)
+            simulation.move(direction)
+            yield self.state(simulation), simulation.won
+        tops = state[5]
+        if tops is None:
+            return
+        unknown = [obj for obj, (stack, forgotten) in zip(self.tracked, tops) if forgotten and not stack]
+        if len(unknown) > MAX_UNKNOWN:
+            raise OverflowError
+        for deltas in product(self.undo_deltas, repeat=len(unknown)):
+            self.restore(state, dict(zip(unknown, deltas)))
+            if simulation.undo():
+                yield self.state(simulation), simulation.won
+
+    def run_search(self, root, root_hash):
+        # parents maps every position to the one it was reached from and its own hash
+        proven = self.proven
+        parents = {root: (None, root_hash)}
+        queue = deque([root])
+        expanded = 0
+        while queue:
+            state = queue.popleft()
+            try:
+                for child, won in self.children(state):
+                    if child in parents:
+                        continue
+                    h = self.state_hash(child)
+                    verdict = proven.get(h)
+                    if verdict == DEAD:
+                        continue
+                    parents[child] = (state, h)
+                    if won or verdict == OPEN:
+                        self.mark_open(parents, child)
+                        return
+                    if len(parents) >= self.max_states:
+                        logger.debug("Dead state search gave up after %d states", len(parents))
+                        return
+                    if not self.static_dead(child):
+                        queue.append(child)
+            except OverflowError:
+                logger.debug("Dead state search gave up on an undo past %d forgotten entries", MAX_UNKNOWN)
+                return
+            expanded += 1
+            if expanded % CHUNK == 0:
+                yield
+        # Nothing reachable wins, which makes every state on the way lost too
+        logger.debug("Dead end proven over %d states", len(parents))
+        work = len(parents)
+        for _, h in parents.values():
+            proven.store(h, DEAD, work)
+        self.verdict = DEAD
+
+    def mark_open(self, parents, state):
+        work = len(parents)
+        while state is not None:
+            state, h = parents[state]
+            self.proven.store(h, OPEN, work)
+
+
+def start_verdict(level_data, max_states=MAX_STATES):
+    # The checker's verdict on the start of a level, with its search run to the end
+    board = Board.from_level_data(level_data)
+    checker = DeadStateChecker(True, max_states)
+    checker.start_level(board)
+    checker.update(Simulation(board))
+    while checker.searching:
+        checker.advance(1.0)
+    return checker.verdict
+
+
+def main():
+    from game.solver import solve_level
+    parser = argparse.ArgumentParser(description="Check that no solvable level starts out as a dead end")
+    parser.add_argument("levels", nargs="*",
+                        help="levels files, defaults to data/levels.json and data/deadlock_checks.json")
+    parser.add_argument("--timeout", type=float, default=30.0, help="solver seconds per level called dead")
+    args = parser.parse_args()
+
+    paths = args.levels or [os.path.normpath(levels_file(path))
+                            for path in ("../data/levels.json", "../data/deadlock_checks.json")]
+    wrong = 0
+    for path in paths:
+        levels = load_levels_data(path)
+        for number, level_data in enumerate(levels, 1):
+            verdict = start_verdict(level_data)
+            if verdict == DEAD:
+                # Only a solution proves the verdict wrong, anything else leaves it standing
+                result = solve_level(level_data, time_limit=args.timeout)
+                if result.solved:
+                    wrong += 1
+                    verdict = f"dead, but solved in {result.length} moves: {result.moves}"
+            print(f"{path} level {number}: {verdict}")
+    if wrong:
+        print(f"{wrong} solvable levels called dead", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
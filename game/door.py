@@ -1,12 +1,11 @@
 import pygame
 import asyncio
+from game.textures import load_texture
 
 class Door:
     def __init__(self, x, y, width, height, image_path="assets/pixel_door_closed.png"):
-        self.movements = []
         self.rect = pygame.Rect(x, y, width, height)
-        self.image = pygame.image.load(image_path)
-        self.image = pygame.transform.scale(self.image, (width, height))
+        self.image = load_texture(image_path, (width, height))
         self.open = False
 
     def is_open(self):
@@ -24,23 +23,6 @@ class Door:
     def open_door(self):
         self.open = True
 
-    def record_movement(self, direction):
-        self.movements.append(direction)
-
-    def move(self, dx, dy):
-        self.rect.x += dx
-        self.rect.y += dy
-        self.record_movement((dx, dy))
-
-    def undo_movement(self):
-        if self.movements:
-            dx, dy = self.movements.pop()
-            self.rect.x -= dx
-            self.rect.y -= dy
-            return -dx, -dy
-        else:
-            return 0, 0
-
     async def shake(self, screen):
         original_position = self.rect.topleft
         shake_distance = 5
@@ -59,8 +41,6 @@ class Door:
 
     def change_image(self):
         if self.open:
-            self.image = pygame.image.load("assets/pixel_door_open.png")
-            self.image = pygame.transform.scale(self.image, (self.rect.width, self.rect.height))
+            self.image = load_texture("assets/pixel_door_open.png", self.rect.size)
         else:
-            self.image = pygame.image.load("assets/pixel_door_closed.png")
-            self.image = pygame.transform.scale(self.image, (self.rect.width, self.rect.height))
+            self.image = load_texture("assets/pixel_door_closed.png", self.rect.size)
@@ -2,21 +2,33 @@ import pygame
 import time
 import logging
 import asyncio
-import sys
 from game.key import Key
 from game.door import Door
 from game.player import Player
 from game.screen import Screen
-from game.levels import create_levels
+from game.levels import LevelRepository, levels_file
+from game.metrics import MetricsIndex, metrics_file
+from game.thumbnails import ThumbnailAtlas, thumbnails_file
+from game.deadlock import DeadStateChecker, DEAD
+from game.hints import HintFile, hints_file, hint_text
+from game.color import Color
 from game.leveleditor import LevelEditor
+from game.scheduler import FrameScheduler, DEFAULT_FPS
+from game.journal import MoveJournal
+from game.replay import REDO, RESET, RESET_GAME
+from game.profiler import FrameProfiler
+from game.persistence import SessionStore, default_storage
+from game.simulation import Simulation, UP, DOWN, LEFT, RIGHT, UNDO, KEY_REMOVED
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Time each frame may spend on a pending dead end search
+SEARCH_SLICE = 0.004
 
 
 class Game:
-    def __init__(self):
-        logging.info("Initializing game")
+    def __init__(self, fps=DEFAULT_FPS, levels_path="../data/levels.json", storage=None):
+        logger.info("Initializing game")
         self.state = "not_started"
         self.screen = Screen()
         self.current_level_index = 0
@@ -26,69 +38,102 @@ class Game:
         self.start_time = None
         self.running = True
         self.challenge = False
-        self.levels_path = "../data/levels.json"
+        self.levels_path = levels_path
+        self.levels = LevelRepository(levels_file(self.levels_path))
+        self.metrics = MetricsIndex(metrics_file(levels_file(self.levels_path)))
+        self.thumbnails = ThumbnailAtlas(thumbnails_file(levels_file(self.levels_path)))
+        self.hints = HintFile(hints_file(levels_file(self.levels_path)))
+        self.hint_table = None
+        self.scheduler = FrameScheduler(fps)
+        self.profiler = FrameProfiler()
+        # Tools and benchmarks pass their own storage so they never touch the player's session
+        self.session = SessionStore(storage if storage is not None else default_storage())
+        self.dead_states = DeadStateChecker()
+        self.screen.profiler = self.profiler
+        self.simulation = None
+        # Optional ReplayRecorder that every accepted input goes to
+        self.recorder = None
 
     def load_level(self, level_index):
-        logging.info(f"Loading level {level_index + 1}")
-        self.levels = create_levels(self.levels_path)
+        logger.info("Loading level %d", level_index + 1)
+        self.levels.refresh()
         level = self.levels[level_index]
         self.player = Player(level.player_start[0], level.player_start[1], self.screen.block_size, self.screen.block_size)
         self.key = Key(level.key_start[0], level.key_start[1], self.screen.block_size, self.screen.block_size)
         self.door = Door(level.door_start[0], level.door_start[1], self.screen.block_size, self.screen.block_size)
         self.blocks = level.blocks
         self.teleports = level.teleports
-        self.initial_player_pos = level.player_start
-        self.initial_key_pos = level.key_start
-        self.initial_door_pos = level.door_start
-        self.initial_block_positions = {block: (block.rect.x, block.rect.y) for block in level.blocks}
+        self.simulation = Simulation(self.levels.board(level_index, self.screen.grid_size, self.screen.block_size), MoveJournal())
+        if self.recorder is not None:
+            self.recorder.level(level_index, self.levels.level_hash(level_index), self.total_moves, self.total_undos, self.total_resets)
+        # Immovable blocks off the teleport pads never leave their cell, they are drawn once per level
+        board = self.simulation.board
+        static = [not block.can_move and not board.pads[cell] for block, cell in zip(self.blocks, board.block_starts)]
+        self.static_blocks = [block for block, is_static in zip(self.blocks, static) if is_static]
+        self.dynamic_blocks = [block for block, is_static in zip(self.blocks, static) if not is_static]
+        self.screen.build_static_layer(self.static_blocks, self.teleports)
+        self.sync_entities()
+        self.dead_states.start_level(board)
+        self.check_dead_state()
+        # Only this level's table is read, and only the first time the level is played
+        self.hints.refresh()
+        self.hint_table = self.hints.table(self.levels.level_hash(level_index), board)
         self.save_current_level()
+        self.session.flush()
+
+    def sync_entities(self):
+        board = self.simulation.board
+        block_size = self.screen.block_size
+        self.player.rect.topleft = board.position(self.simulation.player, block_size)
+        if self.simulation.key == KEY_REMOVED:
+            self.key.delete_key()
+        else:
+            self.key.rect.topleft = board.position(self.simulation.key, block_size)
+        self.door.rect.topleft = board.position(self.simulation.door, block_size)
+        for i in self.simulation.moved_blocks():
+            self.blocks[i].rect.topleft = board.position(self.simulation.blocks[i], block_size)
+        if self.door.open != self.simulation.door_open:
+            if self.simulation.door_open:
+                logger.info("Key and door collided")
+            self.door.open = self.simulation.door_open
+            self.door.change_image()
     
     def save_current_level(self):
-        if self.challenge:
+        # Nothing to save before a game is started or continued
+        if self.challenge or self.start_time is None:
             return
-        if sys.platform == "emscripten":
-            logging.info(f"Saving current level: {self.current_level_index}")
-            from js import window
-            window.localStorage.setItem("current_level_index", str(self.current_level_index))
-            window.localStorage.setItem("total_moves", str(self.total_moves))
-            window.localStorage.setItem("total_undos", str(self.total_undos))
-            window.localStorage.setItem("total_resets", str(self.total_resets))
-            self.elapsed_time = time.time() - self.start_time
-            window.localStorage.setItem("elapsed_time", str(self.elapsed_time))
-            logging.info("Current level and game state saved")
-        else:
-            logging.info("Saving levels is only supported in the browser")
+        start = time.perf_counter()
+        # Coalesced: written at most a few times a second, and right away on level changes and quit
+        self.elapsed_time = time.time() - self.start_time
+        self.session.save({
+            "current_level_index": self.current_level_index,
+            "total_moves": self.total_moves,
+            "total_undos": self.total_undos,
+            "total_resets": self.total_resets,
+            "elapsed_time": self.elapsed_time,
+        })
+        self.profiler.span("save", start)
 
     def load_saved_level(self):
-        if sys.platform == "emscripten":
-            from js import window
-            saved_level = window.localStorage.getItem("current_level_index")
-            if saved_level is not None:
-                self.current_level_index = int(saved_level)
-                self.total_moves = int(window.localStorage.getItem("total_moves"))
-                self.total_undos = int(window.localStorage.getItem("total_undos"))
-                self.total_resets = int(window.localStorage.getItem("total_resets"))
-                self.elapsed_time = float(window.localStorage.getItem("elapsed_time"))
-                self.start_time = time.time() - self.elapsed_time
-                self.load_level(self.current_level_index)
+        session = self.session.load()
+        if session is not None:
+            self.current_level_index = session["current_level_index"]
+            self.total_moves = session["total_moves"]
+            self.total_undos = session["total_undos"]
+            self.total_resets = session["total_resets"]
+            self.elapsed_time = session["elapsed_time"]
+            self.start_time = time.time() - self.elapsed_time
+            self.load_level(self.current_level_index)
 
     def reset_level(self):
-        logging.info("Resetting level")
-        self.player.movements = []
-        self.key.movements = []
-        self.door.movements = []
-        self.player.rect.topleft = self.initial_player_pos
-        self.key.rect.topleft = self.initial_key_pos
-        self.door.rect.topleft = self.initial_door_pos
-        for block in self.blocks:
-            block.rect.topleft = self.initial_block_positions[block]
-            block.movements = []
-        self.door.open = False
-        self.door.change_image()
+        logger.debug("Resetting level")
+        self.simulation.reset()
+        self.sync_entities()
         self.state = "in_progress"
 
     def reset_game(self):
-        logging.info("Resetting game")
+        logger.info("Resetting game")
+        self.record(RESET_GAME)
         self.challenge = False
         self.reset_level()
         self.total_moves = 0
@@ -96,298 +141,331 @@ class Game:
         self.total_resets = 0
 
     def start_game(self, level_index):
-        logging.info("Starting game")
+        logger.info("Starting game")
         self.start_time = time.time()
         self.state = "in_progress"
         self.current_level_index = level_index
         self.load_level(self.current_level_index)
 
     def continue_game(self):
-        logging.info("Continuing game")
+        logger.info("Continuing game")
         self.start_time = time.time()
         self.state = "in_progress"
         self.load_saved_level()
 
     def end_game(self):
-        logging.info("Ending game")
+        logger.info("Ending game")
         self.current_level_index = 0
         self.state = "ended"
 
     def win_game(self):
-        logging.info("Winning game")
+        logger.info("Winning game")
         self.state = "won"
         self.elapsed_time = time.time() - self.start_time
-        # Remove the saved level from browser storage
-        if sys.platform == "emscripten" and not self.challenge:
-            from js import window
-            window.localStorage.removeItem("current_level_index")
+        # A finished game leaves nothing to continue
+        if not self.challenge:
+            self.session.clear()
 
     def get_state(self):
         return self.state
     
     async def shake_if_colliding(self, obj1_pos, obj2_pos, obj1, obj2, obj1_name, obj2_name):
         if obj1_pos == obj2_pos:
-            logging.warning(f"{obj1_name} and {obj2_name} are about to collide")
+            logger.debug("%s and %s are about to collide", obj1_name, obj2_name)
             await asyncio.gather(
                 obj1.shake(self.screen.screen),
                 obj2.shake(self.screen.screen)
             )
     
     async def undo_last_action(self):
-        logging.info("Undoing last action")
-        new_player_pos = (self.player.rect.x, self.player.rect.y)
-        new_key_pos = (self.key.rect.x, self.key.rect.y)
-        new_door_pos = (self.door.rect.x, self.door.rect.y)
-        new_block_positions = {block: (block.rect.x, block.rect.y) for block in self.blocks}
-        if self.player.movements:
-            last_player_move = self.player.movements[-1]
-            new_player_pos = (self.player.rect.x - last_player_move[0], self.player.rect.y - last_player_move[1])
-        if self.key.movements:
-            last_key_move = self.key.movements[-1]
-            new_key_pos = (self.key.rect.x - last_key_move[0], self.key.rect.y - last_key_move[1])
-        if self.door.movements:
-            last_door_move = self.door.movements[-1]
-            new_door_pos = (self.door.rect.x - last_door_move[0], self.door.rect.y - last_door_move[1])
-        for block in self.blocks:
-            if block.movements:
-                last_block_move = block.movements[-1]
-                new_block_positions[block] = (block.rect.x - last_block_move[0], block.rect.y - last_block_move[1])
-
-        player_within_bounds = self.is_within_bounds(new_player_pos[0], new_player_pos[1])
-        key_within_bounds = self.is_within_bounds(new_key_pos[0], new_key_pos[1])
-        door_within_bounds = self.is_within_bounds(new_door_pos[0], new_door_pos[1])
-        blocks_within_bounds = all(self.is_within_bounds(pos[0], pos[1]) for pos in new_block_positions.values())
-
-        def can_move_through_teleport(obj, new_pos):
-            for teleport_pair in self.teleports:
-                if teleport_pair.can_move_through_teleport(obj, new_pos, self.blocks + [self.key, self.door], self.screen.grid_size, self.screen.block_size):
-                    return True
-            return False
-
-        player_not_colliding = (
-            can_move_through_teleport(self.player, new_player_pos) or 
-            (
-                new_player_pos != new_key_pos and
-                new_player_pos != new_door_pos and
-                not any(new_player_pos == new_block_pos for new_block_pos in new_block_positions.values())
-            )
-        )
-
-        key_not_colliding = (
-            can_move_through_teleport(self.key, new_key_pos) or
-            not any(new_key_pos == new_block_pos for new_block_pos in new_block_positions.values())
-        )
-
-        door_not_colliding = (
-            can_move_through_teleport(self.door, new_door_pos) or
-            not any(new_door_pos == new_block_pos for new_block_pos in new_block_positions.values())
-        )
-
-        blocks_not_colliding = (
-            all(can_move_through_teleport(block, new_block_pos) for block, new_block_pos in new_block_positions.items()) or
-            not any(new_block_pos == other_block_pos for block, new_block_pos in new_block_positions.items() for other_block, other_block_pos in new_block_positions.items() if block != other_block)
-        )
-        logging.debug(f"Player not colliding: {player_not_colliding}, Key not colliding: {key_not_colliding}, Door not colliding: {door_not_colliding}, Blocks not colliding: {blocks_not_colliding}")
-        logging.debug(f"Player within bounds: {player_within_bounds}, Key within bounds: {key_within_bounds}, Door within bounds: {door_within_bounds}, Blocks within bounds: {blocks_within_bounds}")
-        if (player_not_colliding and key_not_colliding and door_not_colliding and blocks_not_colliding
-            and player_within_bounds and key_within_bounds and door_within_bounds and blocks_within_bounds):
-            player_dx, player_dy = self.player.undo_movement()
-            key_dx, key_dy = self.key.undo_movement()
-            door_dx, door_dy = self.door.undo_movement()
-            block_movements = []
-            for block in self.blocks:
-                block_dx, block_dy = block.undo_movement()
-                block_movements.append((block, block_dx, block_dy))
-            # Check for teleport collisions after undoing movements
-            all_objects = self.blocks + [self.key, self.door, self.player]
-            no_key_door_objects = self.blocks + [self.player]
-            self._check_teleport_collision(self.teleports, player_dx, player_dy, all_objects, self.player, self.screen.grid_size, self.screen.block_size)
-            self._check_teleport_collision(self.teleports, key_dx, key_dy, no_key_door_objects, self.key, self.screen.grid_size, self.screen.block_size)
-            self._check_teleport_collision(self.teleports, door_dx, door_dy, no_key_door_objects, self.door, self.screen.grid_size, self.screen.block_size)
-            for block, block_dx, block_dy in block_movements:
-                self._check_teleport_collision(self.teleports, block_dx, block_dy, all_objects, block, self.screen.grid_size, self.screen.block_size)
-        else:
-            await self.shake_if_colliding(new_player_pos, new_key_pos, self.player, self.key, "Player", "Key")
-            await self.shake_if_colliding(new_player_pos, new_door_pos, self.player, self.door, "Player", "Door")
-            for block, new_block_pos in new_block_positions.items():
-                await self.shake_if_colliding(new_block_pos, new_player_pos, block, self.player, "Block", "Player")
-                await self.shake_if_colliding(new_block_pos, new_key_pos, block, self.key, "Block", "Key")
-                await self.shake_if_colliding(new_block_pos, new_door_pos, block, self.door, "Block", "Door")
-            await self.shake_if_out_of_bounds(new_player_pos, self.player, "Player")
-            await self.shake_if_out_of_bounds(new_key_pos, self.key, "Key")
-            await self.shake_if_out_of_bounds(new_door_pos, self.door, "Door")
-            for block, new_block_pos in new_block_positions.items():
-                await self.shake_if_out_of_bounds(new_block_pos, block, "Block")
-
-    def is_within_bounds(self, x, y):
-        return self.screen.block_size <= x < self.screen.grid_size * self.screen.block_size and self.screen.block_size <= y < self.screen.grid_size * self.screen.block_size
+        logger.debug("Undoing last action")
+        start = time.perf_counter()
+        undone = self.simulation.undo()
+        self.profiler.span("rules", start)
+        if undone:
+            self.sync_entities()
+            return
+        # Input is blocked until the shakes are over
+        start = time.perf_counter()
+        new_player_pos, new_key_pos, new_door_pos, new_block_positions = self.simulation.undo_targets()
+        await self.shake_if_colliding(new_player_pos, new_key_pos, self.player, self.key, "Player", "Key")
+        await self.shake_if_colliding(new_player_pos, new_door_pos, self.player, self.door, "Player", "Door")
+        for block, new_block_pos in zip(self.blocks, new_block_positions):
+            await self.shake_if_colliding(new_block_pos, new_player_pos, block, self.player, "Block", "Player")
+            await self.shake_if_colliding(new_block_pos, new_key_pos, block, self.key, "Block", "Key")
+            await self.shake_if_colliding(new_block_pos, new_door_pos, block, self.door, "Block", "Door")
+        await self.shake_if_out_of_bounds(new_player_pos, self.player, "Player")
+        await self.shake_if_out_of_bounds(new_key_pos, self.key, "Key")
+        await self.shake_if_out_of_bounds(new_door_pos, self.door, "Door")
+        for block, new_block_pos in zip(self.blocks, new_block_positions):
+            await self.shake_if_out_of_bounds(new_block_pos, block, "Block")
+        # Shakes draw straight onto the window and leave trails in neighbouring cells
+        self.screen.invalidate()
+        self.profiler.span("shake", start)
+
+    def redo_last_undo(self):
+        logger.debug("Redoing last undo")
+        start = time.perf_counter()
+        redone = self.simulation.redo()
+        self.profiler.span("rules", start)
+        if redone:
+            self.sync_entities()
 
     async def shake_if_out_of_bounds(self, new_pos, obj, obj_name):
-        if not self.is_within_bounds(new_pos[0], new_pos[1]):
-            logging.warning(f"{obj_name} is out of bounds")
+        if not self.simulation.board.inside(new_pos):
+            logger.debug("%s is out of bounds", obj_name)
             await obj.shake(self.screen.screen)
 
-    def _check_teleport_collision(self, teleports, dx, dy, objects, obj, grid_size, block_size):
-        for teleport_pair in teleports:
-            teleport_pair.check_and_teleport(obj, dx, dy, objects, grid_size, block_size)
-    
+    def move_player(self, direction):
+        self.record(direction)
+        start = time.perf_counter()
+        self.simulation.move(direction)
+        self.profiler.span("rules", start)
+        self.sync_entities()
+
+    def check_dead_state(self):
+        # Static patterns answer here, anything else is searched in slices from the game loop
+        self.dead_states.update(self.simulation)
+        self.show_dead_state()
+
+    def show_dead_state(self):
+        lost = self.dead_states.enabled and self.dead_states.verdict == DEAD
+        self.screen.set_status("Dead end - press R" if lost else None)
+
+    def show_hint(self):
+        # A hash of the current state and one slot of the level's precomputed table, no search
+        if self.hint_table is None:
+            text = "No hints for this level"
+        else:
+            text = hint_text(self.hint_table.lookup(self.simulation))
+        logger.debug("%s", text)
+        self.screen.set_status(text, Color.YELLOW)
+
+    def toggle_dead_states(self):
+        self.dead_states.enabled = not self.dead_states.enabled
+        logger.info("Dead end indicator %s", "on" if self.dead_states.enabled else "off")
+        self.check_dead_state()
+
+    def record(self, code):
+        if self.recorder is not None:
+            self.recorder.input(code)
+
+    def toggle_profiler(self):
+        self.profiler.visible = not self.profiler.visible
+        logger.info("Profiler overlay %s", "shown" if self.profiler.visible else "hidden")
+        # The overlay covers the bottom border, repaint it when the overlay goes away
+        self.screen.invalidate()
+
+    def save_recording(self, file_path):
+        logger.info("Saving %d recorded inputs to %s", self.recorder.inputs, file_path)
+        self.recorder.save(file_path, self.total_moves, self.total_undos, self.total_resets, self.simulation)
+
     async def handle_events(self):
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
-                logging.info("Received QUIT event")
+                logger.info("Received QUIT event")
+                self.session.flush()
                 self.running = False
-                return
+                return True
             elif event.type == pygame.KEYDOWN:
-                logging.info(f"Key pressed: {pygame.key.name(event.key)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Key pressed: %s", pygame.key.name(event.key))
+                self.profiler.key_pressed()
                 if event.key == pygame.K_w:
-                    self.player.move(0, -self.screen.block_size, self.screen.grid_size, self.screen.block_size, self.key, self.door, self.blocks, self.teleports)
+                    self.move_player(UP)
                     self.total_moves += 1
                     self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_s:
-                    self.player.move(0, self.screen.block_size, self.screen.grid_size, self.screen.block_size, self.key, self.door, self.blocks, self.teleports)
+                    self.move_player(DOWN)
                     self.total_moves += 1
                     self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_a:
-                    self.player.move(-self.screen.block_size, 0, self.screen.grid_size, self.screen.block_size, self.key, self.door, self.blocks, self.teleports)
+                    self.move_player(LEFT)
                     self.total_moves += 1
                     self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_d:
-                    self.player.move(self.screen.block_size, 0, self.screen.grid_size, self.screen.block_size, self.key, self.door, self.blocks, self.teleports)
+                    self.move_player(RIGHT)
                     self.total_moves += 1
                     self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_z:
+                    self.record(UNDO)
                     await self.undo_last_action()
                     self.total_undos += 1
                     self.save_current_level()
+                    self.check_dead_state()
+                elif event.key == pygame.K_y:
+                    self.record(REDO)
+                    self.redo_last_undo()
+                    self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_r:
+                    self.record(RESET)
                     self.reset_level()
                     self.total_resets += 1
                     self.save_current_level()
+                    self.check_dead_state()
                 elif event.key == pygame.K_ESCAPE:
                     self.save_current_level()
+                    self.session.flush()
                     self.reset_game()
                     self.state = "not_started"
+                elif event.key == pygame.K_F3:
+                    self.toggle_profiler()
+                elif event.key == pygame.K_F4:
+                    self.toggle_dead_states()
+                elif event.key == pygame.K_h:
+                    self.show_hint()
 
-            if self.key.rect.colliderect(self.door.rect):
-                logging.info("Key and door collided")
-                self.door.open_door()
-                self.door.change_image()
-                self.key.delete_key()
-            
             # Player win condition
-            if self.player.rect.colliderect(self.door.rect) and self.door.open:
-                logging.info("Player and door collided")
+            if self.simulation.won:
+                logger.info("Player and door collided")
                 self.current_level_index += 1
                 if self.challenge:
-                    logging.info("Level completed")
+                    logger.info("Level completed")
                     self.state = "challenge_menu"
                     self.win_game()
                 elif self.current_level_index < len(self.levels):
                     self.load_level(self.current_level_index)
                 else:
-                    logging.info("No more levels to load")
+                    logger.info("No more levels to load")
                     self.win_game()
+        return bool(events)
 
     def handle_menu_events(self, start_rect, edit_rect, continue_rect, challenge_rect):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                logging.info("Received QUIT event in menu")
+                logger.info("Received QUIT event in menu")
                 self.running = False
                 return False
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                logging.info(f"Mouse button down at position: {event.pos}")
+                logger.debug("Mouse button down at position: %s", event.pos)
                 if start_rect.collidepoint(event.pos):
-                    logging.info("Start button clicked")
+                    logger.info("Start button clicked")
                     self.start_game(level_index=0)
                     return True
                 elif challenge_rect and challenge_rect.collidepoint(event.pos):
-                    logging.info("Levels button clicked")
+                    logger.info("Levels button clicked")
                     self.state = "challenge_menu"
                     return True
                 elif edit_rect and edit_rect.collidepoint(event.pos):
-                    logging.info("Edit button clicked")
-                    editor = LevelEditor(self.screen)
+                    logger.info("Edit button clicked")
+                    editor = LevelEditor(self.screen, levels=self.levels)
                     editor.run()
-                    self.levels = create_levels(self.levels_path)
+                    self.levels.refresh()
                 elif continue_rect and continue_rect.collidepoint(event.pos):
-                    logging.info("Continue button clicked")
+                    logger.info("Continue button clicked")
                     self.continue_game()
                     return True
         return True
     
+    def update_thumbnails(self):
+        # Renders previews of new or edited levels in the background, the worker reads the levels itself
+        self.thumbnails.update(self.levels.file_path)
+
+    def show_challenge_menu(self, index):
+        # Par and difficulty come from the precomputed metrics index, nothing is solved here
+        content_hash = self.levels.level_hash(index)
+        self.shown_thumbnails = self.thumbnails.generation
+        return self.screen.display_challenge_menu(index, self.metrics.get(content_hash), self.thumbnails.get(content_hash))
+
     async def handle_challenge_events(self):
         current_index = 0
-        self.levels = create_levels(self.levels_path)
-        left_rect, middle_rect, right_rect = self.screen.display_challenge_menu(current_index)
+        self.levels.refresh()
+        self.metrics.refresh()
+        self.update_thumbnails()
+        left_rect, middle_rect, right_rect = self.show_challenge_menu(current_index)
 
         running = True
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    logging.info("Received QUIT event in Levels")
+                    logger.info("Received QUIT event in Levels")
                     self.running = False
                     return False
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
-                        logging.info("Return button clicked")
+                        logger.info("Return button clicked")
                         self.state = "not_started"
                         return False
                     elif event.key == pygame.K_RIGHT:
                         current_index = (current_index + 1) % len(self.levels)
                     elif event.key == pygame.K_LEFT:
                         current_index = (current_index - 1) % len(self.levels)
-                    left_rect, middle_rect, right_rect = self.screen.display_challenge_menu(current_index)
+                    left_rect, middle_rect, right_rect = self.show_challenge_menu(current_index)
                 elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    logging.info(f"Mouse button down at position: {event.pos}")
+                    logger.debug("Mouse button down at position: %s", event.pos)
                     if left_rect.collidepoint(event.pos):
                         current_index = (current_index - 1) % len(self.levels)
-                        left_rect, middle_rect, right_rect = self.screen.display_challenge_menu(current_index)
+                        left_rect, middle_rect, right_rect = self.show_challenge_menu(current_index)
                     elif right_rect.collidepoint(event.pos):
                         current_index = (current_index + 1) % len(self.levels)
-                        left_rect, middle_rect, right_rect = self.screen.display_challenge_menu(current_index)
+                        left_rect, middle_rect, right_rect = self.show_challenge_menu(current_index)
                     elif middle_rect.collidepoint(event.pos):
-                        logging.info(f"Level {current_index} selected")
+                        logger.info("Level %d selected", current_index)
                         self.state = "in_progress"
                         self.challenge = True
                         self.start_game(current_index)
                         return True
-            await asyncio.sleep(0)
+            if self.thumbnails.generation != self.shown_thumbnails:
+                left_rect, middle_rect, right_rect = self.show_challenge_menu(current_index)
+            await self.scheduler.next_frame(idle=True)
         return True
         
     async def handle_winning_screen_events(self, return_rect):
         while True:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    logging.info("Received QUIT event on winning screen")
+                    logger.info("Received QUIT event on winning screen")
                     self.end_game()
                     return False
                 elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:  # Check for left mouse button
-                    logging.info(f"Left mouse button down at position: {event.pos}")
+                    logger.debug("Left mouse button down at position: %s", event.pos)
                     if return_rect.collidepoint(event.pos):
-                        logging.info("Return button clicked on winning screen")
+                        logger.info("Return button clicked on winning screen")
                         return True
-            await asyncio.sleep(0)
+            await self.scheduler.next_frame(idle=True)
 
     async def run(self):
+        self.update_thumbnails()
         while self.running:
             while self.get_state() == "not_started":
-                start_rect, edit_rect, continue_rect, challenge_rect = self.screen.display_menu()
+                start_rect, edit_rect, continue_rect, challenge_rect = self.screen.display_menu(self.session.exists())
                 while self.get_state() == "not_started":
                     if not self.handle_menu_events(start_rect, edit_rect, continue_rect, challenge_rect):
-                        logging.info("Exiting game from menu")
+                        logger.info("Exiting game from menu")
                         return  # Exit the run function
-                    await asyncio.sleep(0)
+                    await self.scheduler.next_frame(idle=True)
 
             while self.get_state() == "in_progress":
-                await self.handle_events()
-                self.screen.update_screen(self.player, self.key, self.door, self.blocks, self.teleports, self.current_level_index + 1, len(self.levels))
+                profiler = self.profiler
+                profiler.start_frame()
+                handled = await self.handle_events()
+                profiler.mark("events")
+                searching = self.dead_states.searching
+                if searching and self.dead_states.advance(SEARCH_SLICE):
+                    self.show_dead_state()
+                profiler.mark("search")
+                self.screen.update_screen(self.player, self.key, self.door, self.dynamic_blocks, self.current_level_index + 1, len(self.levels))
+                profiler.presented()
+                self.session.tick()
+                if profiler.visible:
+                    self.screen.draw_overlay(profiler.overlay_lines())
+                profiler.mark("render")
                 if not self.running:
-                    logging.info("Exiting game from in progress")
+                    logger.info("Exiting game from in progress")
                     return
-                await asyncio.sleep(0)
+                # Nothing moves on screen without input, so wait for the next event once the frame is drawn
+                await self.scheduler.next_frame(idle=not handled and not searching)
+                profiler.mark("wait")
+                profiler.end_frame()
 
             if self.get_state() == "ended":
-                logging.info("Game ended, resetting game")
+                logger.info("Game ended, resetting game")
                 self.reset_game()
                 self.state = "not_started"
 
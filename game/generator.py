@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from game.levels import LevelRepository, level_hash
+from game.levelpack import write_pack
+from game.levelstore import LevelStore
+from game.metrics import difficulty, reachable_states, DIFFICULTY_REACHABLE
+from game.deadlock import DeadStateChecker
+from game.simulation import Board
+from game.solver import Solver
+
+UNIT = 80
+# Candidates one worker task generates before it reports back; small, because a stopped run still waits
+# for the batches that are running
+BATCH = 8
+
+
+class GeneratorSettings:
+    # What a candidate may contain and what an accepted level has to be. Densities are shares of the
+    # interior cells; the solver budget is kept small so that hopeless candidates are dropped quickly,
+    # and only levels whose shortest solution the solver proves within it are accepted.
+    def __init__(self, grid_size=10, density=(0.15, 0.45), movable=(0, 3), teleport_chance=0.3,
+                 min_moves=12, min_rating=2, max_rating=5, max_states=20_000, time_limit=2.0):
+        self.grid_size = grid_size
+        self.density = density
+        self.movable = movable
+        self.teleport_chance = teleport_chance
+        self.min_moves = min_moves
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+        self.max_states = max_states
+        self.time_limit = time_limit
+
+
+def sample_level(rng, settings):
+    # Player, key, door, blocks and at most one teleport pair on distinct interior cells
+    grid_size = settings.grid_size
+    cells = [(x, y) for y in range(1, grid_size) for x in range(1, grid_size)]
+    blocks = int(len(cells) * rng.uniform(*settings.density))
+    movable = rng.randint(*settings.movable)
+    teleports = 1 if rng.random() < settings.teleport_chance else 0
+    chosen = rng.sample(cells, min(len(cells), 3 + blocks + movable + 2 * teleports))
+    pixels = [[x * UNIT, y * UNIT] for x, y in chosen]
+    player, key, door = pixels[:3]
+    placed = pixels[3:3 + blocks + movable]
+    pads = pixels[3 + blocks + movable:]
+    return {
+        "player_start": player,
+        "key_start": key,
+        "door_start": door,
+        "blocks": [cell + [UNIT, UNIT, i >= blocks] for i, cell in enumerate(placed)],
+        "teleports": [[pads[0] + [UNIT, UNIT], pads[1] + [UNIT, UNIT]]] if len(pads) == 2 else [],
+    }
+
+
+def evaluate(level_data, settings):
+    # Rejection reason, or None and the level's metrics. Static dead ends go before any search.
+    board = Board.from_level_data(level_data, settings.grid_size, UNIT)
+    checker = DeadStateChecker(True)
+    checker.start_level(board)
+    if checker.static_dead(checker.state(checker.simulation)):
+        return "dead_start", None
+    if all(checker.solid[board.player_start + d] for d in board.deltas):
+        return "boxed_in", None
+    result = Solver(board, None, settings.max_states, settings.time_limit).solve()
+    if result.status == "unsolvable":
+        return "unsolvable", None
+    if not result.solved:
+        # Out of time or states before any solution turned up
+        return "undecided", None
+    if not result.optimal:
+        # Difficulty is scored on the shortest solution, a longer one would overrate the level
+        return "unproven", None
+    if result.length < settings.min_moves:
+        return "trivial", None
+    undos = result.moves.count("z")
+    # Counted only as far as difficulty looks
+    reachable, _ = reachable_states(board, DIFFICULTY_REACHABLE)
+    score, rating = difficulty(result.length, undos, reachable)
+    if not settings.min_rating <= rating <= settings.max_rating:
+        return "rating", None
+    return None, {
+        "par": result.length,
+        "undos_in_solution": undos,
+        "search_states": result.states,
+        # Effective branching factor: the search size spread evenly over the solution length
+        "branching": round(result.states ** (1 / result.length), 3),
+        "difficulty": score,
+        "rating": rating,
+        "moves": result.moves,
+    }
+
+
+def generate_batch(seed, count, settings, deadline=None):
+    # One worker task: count candidates from their own seed, so every run with the same seed is the same.
+    # Stops early at the deadline, a wall clock time.
+    rng = random.Random(seed)
+    accepted = []
+    rejected = {}
+    for _ in range(count):
+        if deadline and time.time() > deadline:
+            break
+        level_data = sample_level(rng, settings)
+        reason, metrics = evaluate(level_data, settings)
+        if reason is None:
+            accepted.append((level_data, metrics))
+        else:
+            rejected[reason] = rejected.get(reason, 0) + 1
+    return accepted, rejected
+
+
+def generate(settings, workers=None, seed=0, batch=BATCH, deadline=None):
+    # Keeps every worker busy with batches of candidates and yields (accepted, rejected) as batches come
+    # back, until the caller stops iterating or the deadline (wall clock) passes. Batches not started
+    # are dropped then and running ones stop at the deadline.
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = {executor.submit(generate_batch, seed + i, batch, settings, deadline) for i in range(2 * workers)}
+        next_seed = seed + len(pending)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if not deadline or time.time() < deadline:
+                    pending.add(executor.submit(generate_batch, next_seed, batch, settings, deadline))
+                    next_seed += 1
+                yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate solver-verified levels into a level pack")
+    parser.add_argument("output", help="level pack to add the levels to, created when missing")
+    parser.add_argument("--count", type=int, default=100, help="levels to accept")
+    parser.add_argument("--minutes", type=float, help="stop after this long even with fewer levels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid-size", type=int, default=10, help="the game itself plays 10x10 levels")
+    parser.add_argument("--min-moves", type=int, default=12, help="shorter solutions count as trivial")
+    parser.add_argument("--min-rating", type=int, default=2)
+    parser.add_argument("--max-rating", type=int, default=5)
+    parser.add_argument("--max-states", type=int, default=20_000, help="solver states per candidate")
+    parser.add_argument("--timeout", type=float, default=2.0, help="solver seconds per candidate")
+    args = parser.parse_args()
+
+    settings = GeneratorSettings(args.grid_size, min_moves=args.min_moves, min_rating=args.min_rating,
+                                 max_rating=args.max_rating, max_states=args.max_states, time_limit=args.timeout)
+    if not os.path.exists(args.output):
+        write_pack([], args.output)
+    # Accepted levels go through the save journal, so the game and the tools can load the pack while
+    # it grows; compaction folds them into the pack itself
+    levels = LevelRepository(args.output)
+    store = LevelStore(args.output)
+    known = {levels.level_hash(i) for i in range(len(levels))}
+    count = len(levels)
+    start = time.perf_counter()
+    # Wall clock, the worker processes check it too
+    deadline = time.time() + 60 * args.minutes if args.minutes else None
+    accepted = candidates = 0
+    rejected = {}
+    for batch, batch_rejected in generate(settings, args.workers, args.seed, deadline=deadline):
+        candidates += len(batch) + sum(batch_rejected.values())
+        for reason, number in batch_rejected.items():
+            rejected[reason] = rejected.get(reason, 0) + number
+        for level_data, metrics in batch:
+            content_hash = level_hash(level_data)
+            if content_hash in known or accepted >= args.count:
+                continue
+            known.add(content_hash)
+            store.save(count, level_data)
+            print(json.dumps({"level": count + 1, "hash": content_hash, **metrics}), flush=True)
+            count += 1
+            accepted += 1
+        if accepted >= args.count or (deadline and time.time() > deadline):
+            break
+    store.wait()
+    store.compact()
+    elapsed = time.perf_counter() - start
+    print(f"Accepted {accepted} of {candidates} candidates in {elapsed:.1f}s "
+          f"({3600 * candidates / elapsed:.0f} candidates an hour), rejected {json.dumps(rejected)}, "
+          f"pack at {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import os
+import sys
+import time
+import struct
+import hashlib
+import argparse
+from array import array
+from collections import deque
+from game.levels import LevelRepository, level_hash, levels_file
+from game.simulation import Board, Simulation, ACTIONS, UNDO
+from game.solver import Solver, ACTION_KEYS, HEURISTIC_UNDO_DEPTH
+
+# Hint file layout, all little-endian:
+#   header     "PZHT", u16 version, u32 level count
+#   directory  per level: 20-byte SHA-1 content hash, u32 offset and u32 size of its table
+#   tables     u8 undo depth, u8 complete, u32 salt, u32 states, u32 slots, u32 buckets, then
+#              u16 pilot per bucket, u32 check per slot (0 when empty), u16 distance per slot, u8 action per slot
+MAGIC = b"PZHT"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+ENTRY = struct.Struct("<20sII")
+TABLE = struct.Struct("<BBIIII")
+
+DEFAULT_MAX_STATES = 500_000
+DEFAULT_TIMEOUT = 120.0
+# Slots per state of the perfect hash and states per bucket; a lower load makes the pilot search quicker
+LOAD = 0.9
+BUCKET_SIZE = 4
+MAX_PILOT = 0xFFFF
+MAX_SALTS = 16
+GOLDEN = 0x9E3779B1
+MASK32 = 0xFFFFFFFF
+UNREACHED = 0xFFFF
+
+
+def hints_file(levels_path):
+    return levels_path + ".hints"
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def state_hash(key, salt):
+    # 64 bits that place the state and 32 that check it, stable across processes unlike hash()
+    digest = hashlib.blake2b(key, digest_size=12, salt=salt.to_bytes(8, "little")).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") or 1
+
+
+def _slot(h, pilot, slots):
+    return ((h >> 32) ^ (pilot * GOLDEN & MASK32)) % slots
+
+
+def distance_graph(board, undo_depth=HEURISTIC_UNDO_DEPTH, max_states=DEFAULT_MAX_STATES, time_limit=None):
+    # Every state the solver's model reaches from the level start, merged as the solver merges them,
+    # and the actions between them. Won states are not expanded.
+    solver = Solver(board, undo_depth)
+    simulation = solver.simulation
+    simulation.reset()
+    start = simulation.snapshot()
+    keys = [solver.encode(start, undo_depth)]
+    index = {keys[0]: 0}
+    won = bytearray(1)
+    sources, targets, moves = array('I'), array('I'), bytearray()
+    queue = deque([(0, start)])
+    deadline = time.perf_counter() + time_limit if time_limit else None
+    complete = True
+    expanded = 0
+    while queue:
+        expanded += 1
+        if deadline and expanded % 1024 == 0 and time.perf_counter() > deadline:
+            complete = False
+            break
+        i, snapshot = queue.popleft()
+        dirty = True
+        for action in ACTIONS:
+            if dirty:
+                simulation.restore(snapshot)
+            changed = simulation.step(action)
+            if not changed and action == UNDO:
+                dirty = False
+                continue
+            child = simulation.snapshot()
+            if not changed and child == snapshot:
+                dirty = False
+                continue
+            dirty = True
+            key = solver.encode(child, undo_depth)
+            j = index.get(key)
+            if j is None:
+                if len(keys) >= max_states:
+                    complete = False
+                    continue
+                j = index[key] = len(keys)
+                keys.append(key)
+                won.append(simulation.won)
+                if not simulation.won:
+                    queue.append((j, child))
+            sources.append(i)
+            targets.append(j)
+            moves.append(action)
+    return keys, won, sources, targets, moves, complete
+
+
+def retrograde_distances(count, won, sources, targets, moves):
+    # Breadth-first from the won states over the reversed edges: moves to the door and the first action
+    # of a shortest way, for every state that has one
+    starts = array('I', bytes(4 * (count + 1)))
+    for j in targets:
+        starts[j + 1] += 1
+    for j in range(count):
+        starts[j + 1] += starts[j]
+    fill = array('I', starts)
+    incoming = array('I', bytes(4 * len(targets)))
+    for edge, j in enumerate(targets):
+        incoming[fill[j]] = edge
+        fill[j] += 1
+    distances = array('H', [UNREACHED]) * count
+    actions = bytearray(count)
+    queue = deque(j for j in range(count) if won[j])
+    for j in queue:
+        distances[j] = 0
+    while queue:
+        j = queue.popleft()
+        distance = min(distances[j] + 1, UNREACHED - 1)
+        for edge in incoming[starts[j]:starts[j + 1]]:
+            i = sources[edge]
+            if distances[i] == UNREACHED:
+                distances[i] = distance
+                actions[i] = moves[edge]
+                queue.append(i)
+    return distances, actions
+
+
+def perfect_hash(keys):
+    # Hash and displace: states are spread over buckets, and every bucket, largest first, gets the
+    # smallest pilot that sends all its states to free slots. A lookup is then one hash and one slot.
+    count = len(keys)
+    slots = int(count / LOAD) + 1
+    buckets = count // BUCKET_SIZE + 1
+    for salt in range(MAX_SALTS):
+        hashes = [state_hash(key, salt) for key in keys]
+        members = [[] for _ in range(buckets)]
+        for i, (h, check) in enumerate(hashes):
+            members[(h & MASK32) % buckets].append(i)
+        pilots = array('H', bytes(2 * buckets))
+        placed = [0] * count
+        taken = bytearray(slots)
+        failed = False
+        for bucket in sorted(range(buckets), key=lambda bucket: -len(members[bucket])):
+            states = members[bucket]
+            if not states:
+                break
+            for pilot in range(MAX_PILOT + 1):
+                chosen = [_slot(hashes[i][0], pilot, slots) for i in states]
+                if len(set(chosen)) == len(chosen) and not any(taken[slot] for slot in chosen):
+                    break
+            else:
+                # Two states of the bucket always collide, try another salt
+                failed = True
+                break
+            pilots[bucket] = pilot
+            for i, slot in zip(states, chosen):
+                placed[i] = slot
+                taken[slot] = 1
+        if not failed:
+            return salt, slots, pilots, placed, [check for h, check in hashes]
+    raise ValueError(f"No perfect hash for {count} states after {MAX_SALTS} salts")
+
+
+def build_table(level_data, undo_depth=HEURISTIC_UNDO_DEPTH, max_states=DEFAULT_MAX_STATES, time_limit=DEFAULT_TIMEOUT):
+    # One level's packed table, only the states from which the door can be reached go in
+    board = Board.from_level_data(level_data)
+    keys, won, sources, targets, moves, complete = distance_graph(board, undo_depth, max_states, time_limit)
+    distances, actions = retrograde_distances(len(keys), won, sources, targets, moves)
+    kept = [i for i in range(len(keys)) if distances[i] not in (0, UNREACHED)]
+    salt, slots, pilots, placed, checks = perfect_hash([keys[i] for i in kept])
+    slot_checks = array('I', bytes(4 * slots))
+    slot_distances = array('H', bytes(2 * slots))
+    slot_actions = bytearray(slots)
+    for i, slot, check in zip(kept, placed, checks):
+        slot_checks[slot] = check
+        slot_distances[slot] = distances[i]
+        slot_actions[slot] = actions[i]
+    return b"".join((
+        TABLE.pack(undo_depth, complete, salt, len(kept), slots, len(pilots)),
+        _little_endian(pilots), _little_endian(slot_checks), _little_endian(slot_distances), bytes(slot_actions),
+    ))
+
+
+class HintTable:
+    # Distance to the door and best next action for the states of one level. A state that is not in
+    # the table (never reached by the build, or with no way to the door) gives None.
+    #
+    # The table is keyed like the solver's merged states, on the top undo entries only. A move always
+    # leads where the table says, an undo reads entries below those and may not. So every hint is checked
+    # by playing it on a copy of the real state: it is only given when it wins or ends in a state the
+    # table has that is closer to the door, otherwise the best other action that does is. When none
+    # does, hints run out.
+    def __init__(self, board, data):
+        undo_depth, self.complete, self.salt, self.states, slots, buckets = TABLE.unpack_from(data, 0)
+        position = TABLE.size
+        sections = []
+        for typecode, count in (('H', buckets), ('I', slots), ('H', slots)):
+            size = array(typecode).itemsize * count
+            sections.append(_from_little_endian(typecode, data[position:position + size]))
+            position += size
+        self.pilots, self.checks, self.distances = sections
+        self.actions = bytes(data[position:position + slots])
+        self.slots = slots
+        # Keys are built exactly as in the build, from the solver's state encoding
+        self.undo_depth = undo_depth
+        self.solver = Solver(board, undo_depth)
+        self.simulation = Simulation(board)
+
+    def get(self, snapshot):
+        # (distance, action) stored for the state, or None
+        h, check = state_hash(self.solver.encode(snapshot, self.undo_depth), self.salt)
+        slot = _slot(h, self.pilots[(h & MASK32) % len(self.pilots)], self.slots)
+        if self.checks[slot] != check:
+            return None
+        return self.distances[slot], self.actions[slot]
+
+    def outcome(self, snapshot, action):
+        # Distance left after playing the action for real: 0 when it wins, None when the table lacks the result
+        simulation = self.simulation
+        simulation.restore(snapshot)
+        if not simulation.step(action) and simulation.snapshot() == snapshot:
+            return None
+        if simulation.won:
+            return 0
+        hint = self.get(simulation.snapshot())
+        return hint[0] if hint is not None else None
+
+    def lookup(self, simulation):
+        if not self.states:
+            return None
+        snapshot = simulation.snapshot()
+        hint = self.get(snapshot)
+        if hint is None:
+            return None
+        distance, action = hint
+        if self.outcome(snapshot, action) == distance - 1:
+            return hint
+        # Only actions that get closer, so following hints always ends
+        left = [(self.outcome(snapshot, other), other) for other in ACTIONS if other != action]
+        left = [(after, other) for after, other in left if after is not None and after < distance]
+        if not left:
+            return None
+        after, action = min(left)
+        return after + 1, action
+
+
+class HintFile:
+    # Tables of every level in one file next to the levels file, keyed by level content hash. Only the
+    # directory is read up front, a level's table is read when it is asked for and kept.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.mtime = None
+        self.directory = {}
+        self.tables = {}
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        self.directory = {}
+        self.tables = {}
+        if mtime is not None:
+            with open(self.file_path, 'rb') as f:
+                magic, version, count = HEADER.unpack(f.read(HEADER.size))
+                if magic == MAGIC and version == VERSION:
+                    for _ in range(count):
+                        digest, offset, size = ENTRY.unpack(f.read(ENTRY.size))
+                        self.directory[digest.hex()] = (offset, size)
+        return True
+
+    def __contains__(self, content_hash):
+        return content_hash in self.directory
+
+    def table(self, content_hash, board):
+        if content_hash not in self.tables:
+            if content_hash not in self.directory:
+                return None
+            offset, size = self.directory[content_hash]
+            with open(self.file_path, 'rb') as f:
+                f.seek(offset)
+                self.tables[content_hash] = HintTable(board, f.read(size))
+        return self.tables[content_hash]
+
+    def raw(self, content_hash):
+        offset, size = self.directory[content_hash]
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def write(self, tables):
+        # tables: content hash -> packed table. Written to a temporary file and renamed over the old one.
+        offset = HEADER.size + ENTRY.size * len(tables)
+        entries = []
+        for content_hash, data in tables.items():
+            entries.append(ENTRY.pack(bytes.fromhex(content_hash), offset, len(data)))
+            offset += len(data)
+        temporary = self.file_path + ".tmp"
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(tables)))
+            f.writelines(entries)
+            f.writelines(tables.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.file_path)
+        self.refresh()
+
+    def update(self, levels_data, workers=None, max_states=DEFAULT_MAX_STATES, time_limit=DEFAULT_TIMEOUT):
+        # Builds tables only for levels not in the file yet and drops those of levels that are gone
+        hashes = [level_hash(level_data) for level_data in levels_data]
+        by_hash = dict(zip(hashes, levels_data))
+        tables = {content_hash: self.raw(content_hash) for content_hash in self.directory if content_hash in by_hash}
+        missing = [content_hash for content_hash in by_hash if content_hash not in tables]
+        if missing:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(build_table, by_hash[content_hash], HEURISTIC_UNDO_DEPTH, max_states, time_limit):
+                           content_hash for content_hash in missing}
+                for future in as_completed(futures):
+                    tables[futures[future]] = future.result()
+                    yield futures[future], tables[futures[future]]
+        self.write({content_hash: tables[content_hash] for content_hash in by_hash if content_hash in tables})
+
+
+def hint_text(hint):
+    if hint is None:
+        return "No hint here"
+    distance, action = hint
+    # The distance is counted in the solver's merged states, where states that differ only below the top
+    # undo entries are one, so it is an estimate and not a proven number of presses
+    return f"Hint: {ACTION_KEYS[action].upper()} (about {distance} to go)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the hint tables the game's H key reads")
+    parser.add_argument("levels", nargs="?", help="levels file, defaults to data/levels.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds of search per level")
+    parser.add_argument("--max-states", type=int, default=DEFAULT_MAX_STATES)
+    args = parser.parse_args()
+
+    levels_path = args.levels or levels_file("../data/levels.json")
+    levels = LevelRepository(levels_path)
+    hints = HintFile(hints_file(levels_path))
+    start = time.perf_counter()
+    built = 0
+    for content_hash, data in hints.update([levels.data(i) for i in range(len(levels))], args.workers,
+                                           args.max_states, args.timeout or None):
+        built += 1
+        undo_depth, complete, salt, states, slots, buckets = TABLE.unpack_from(data, 0)
+        print(f"{content_hash}: {states} states with a way to the door, {len(data)} bytes"
+              f"{'' if complete else ', search cut short'}", flush=True)
+    print(f"Built {built} of {len(levels)} hint tables in {time.perf_counter() - start:.2f}s, "
+          f"file at {hints.file_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
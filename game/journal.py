@@ -0,0 +1,65 @@
+from array import array
+
+# Journal object code for the door-open flag, next to the object numbers of game.simulation
+DOOR_OPEN = -1
+# Undo transactions kept for redo, older ones are dropped first. This bounds the journal only, the undo
+# stacks of game.simulation keep every move
+MAX_TRANSACTIONS = 1024
+
+
+class MoveJournal:
+    # Undo transactions packed into one int array. A transaction is a run of records, one per object it changed:
+    #   object, old cell, new cell, old stack length, new stack length, old stack top, pushed deltas...
+    # An undo pops every non-empty stack once, teleports may then push onto it again: the pushed deltas are
+    # the new length - max(old length - 1, 0) entries on top of what was left after the pop.
+    def __init__(self, max_transactions=MAX_TRANSACTIONS):
+        self.max_transactions = max_transactions
+        self.records = array('i')
+        self.starts = array('I')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def clear(self):
+        del self.records[:]
+        del self.starts[:]
+
+    def begin(self):
+        self.starts.append(len(self.records))
+
+    def record(self, obj, old, new, old_length, new_length, old_top, pushed=()):
+        self.records.extend((obj, old, new, old_length, new_length, old_top))
+        self.records.extend(pushed)
+
+    def rollback_empty(self):
+        # Drop the transaction opened by begin() when nothing was recorded into it
+        if self.starts and self.starts[-1] == len(self.records):
+            self.starts.pop()
+            return True
+        return False
+
+    def trim(self):
+        if len(self.starts) <= 2 * self.max_transactions:
+            return
+        drop = len(self.starts) - self.max_transactions
+        offset = self.starts[drop]
+        del self.records[:offset]
+        del self.starts[:drop]
+        for i in range(len(self.starts)):
+            self.starts[i] -= offset
+
+    def pop(self):
+        # Records of the newest transaction, newest record first
+        start = self.starts.pop()
+        records = self.records
+        entries = []
+        position = start
+        while position < len(records):
+            obj, old, new, old_length, new_length, old_top = records[position:position + 6]
+            position += 6
+            pushed = records[position:position + new_length - max(old_length - 1, 0)]
+            position += len(pushed)
+            entries.append((obj, old, new, old_length, new_length, old_top, pushed))
+        del records[start:]
+        entries.reverse()
+        return entries
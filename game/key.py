@@ -1,36 +1,18 @@
 import pygame
 import asyncio
+from game.textures import load_texture
 
 class Key:
     def __init__(self, x, y, width, height, image_path="assets/pixel_key.png"):
-        self.movements = []
         self.rect = pygame.Rect(x, y, width, height)
-        self.image = pygame.image.load(image_path)
-        self.image = pygame.transform.scale(self.image, (width, height))
+        self.image = load_texture(image_path, (width, height))
 
     def draw(self, screen):
         screen.blit(self.image, self.rect.topleft)
 
-    def record_movement(self, direction):
-        self.movements.append(direction)
-
     def is_moveable(self):
         return True
 
-    def move(self, dx, dy):
-        self.rect.x += dx
-        self.rect.y += dy
-        self.record_movement((dx, dy))
-
-    def undo_movement(self):
-        if self.movements:
-            dx, dy = self.movements.pop()
-            self.rect.x -= dx
-            self.rect.y -= dy
-            return -dx, -dy
-        else:
-            return 0, 0
-    
     def delete_key(self):
         self.rect.x = -100
         self.rect.y = -100
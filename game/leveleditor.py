@@ -1,5 +1,4 @@
 import pygame
-import json
 import os
 import logging
 from game.block import Block
@@ -8,15 +7,17 @@ from game.key import Key
 from game.door import Door
 from game.color import Color
 from game.teleport import Teleport, TeleportPair
+from game.text import get_font, render_text, render_lines
+from game.scheduler import wait_for_input
+from game.levels import LevelRepository
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 pygame.init()
 
 class LevelEditor:
-    def __init__(self, screen, level_index=None):
-        logging.info("Initializing LevelEditor")
+    def __init__(self, screen, level_index=None, levels=None):
+        logger.info("Initializing LevelEditor")
         self.screen = screen
         self.block_size = screen.block_size
 
@@ -37,12 +38,12 @@ class LevelEditor:
         self.levels_path = os.path.join(os.path.dirname(__file__), '../data/levels.json')
 
         # Return to menu button
-        self.button_font = pygame.font.SysFont("monospace", 30)
-        self.return_button_text = self.button_font.render("Return Menu", True, Color.WHITE)
+        self.button_font = get_font(30)
+        self.return_button_text = render_text("Return Menu", 30, Color.WHITE)
         self.return_button_rect = self.return_button_text.get_rect(center=(self.screen.width // 2, 30))
 
         # Load levels
-        self.load_levels()
+        self.load_levels(levels)
 
         # History for undoing actions
         self.history = []
@@ -59,39 +60,38 @@ class LevelEditor:
 
     def load_level(self, level_index):
         try:
-            logging.info(f"Loading level {level_index + 1}")
-            level_data = self.levels[level_index]
+            logger.info("Loading level %d", level_index + 1)
+            level_data = self.levels.data(level_index)
             self.player_start = Player(level_data["player_start"][0], level_data["player_start"][1], self.block_size, self.block_size)
             self.key_start = Key(level_data["key_start"][0], level_data["key_start"][1], self.block_size, self.block_size)
             self.door_start = Door(level_data["door_start"][0], level_data["door_start"][1], self.block_size, self.block_size)
             self.blocks = [Block(*block) for block in level_data["blocks"]]
             self.teleports = [TeleportPair(teleport[0][0], teleport[0][1], teleport[1][0], teleport[1][1], self.block_size, self.block_size) for teleport in level_data.get("teleports", [])]
         except IndexError:
-            logging.error("Level not found")
+            logger.error("Level not found")
 
-    def load_levels(self):
-        try:
-            logging.info("Loading levels from file")
-            with open(self.levels_path, 'r') as f:
-                self.levels = json.load(f)
-        except FileNotFoundError:
-            logging.warning("Levels file not found, initializing with empty levels")
-            self.levels = []
+    def load_levels(self, levels=None):
+        logger.info("Loading levels from file")
+        # Share the game's repository when given one, saves then show up there without a reload
+        self.levels = levels if levels is not None else LevelRepository(self.levels_path)
+        self.levels.refresh()
+        if not len(self.levels):
+            logger.warning("Levels file not found or empty, initializing with empty levels")
 
     def save_level(self):
-        logging.info("Saving current level")
+        logger.info("Saving current level")
         # Validation checks
         if not self.player_start:
-            logging.error("Cannot save level: Player is missing")
+            logger.error("Cannot save level: Player is missing")
             return
         if not self.key_start:
-            logging.error("Cannot save level: Key is missing")
+            logger.error("Cannot save level: Key is missing")
             return
         if not self.door_start:
-            logging.error("Cannot save level: Door is missing")
+            logger.error("Cannot save level: Door is missing")
             return
         if not self.blocks:
-            logging.error("Cannot save level: At least one block is required")
+            logger.error("Cannot save level: At least one block is required")
             return
         
         level_data = {
@@ -103,14 +103,10 @@ class LevelEditor:
                         [teleport.teleport2.rect.x, teleport.teleport2.rect.y, teleport.teleport2.rect.width, teleport.teleport2.rect.height]] for teleport in self.teleports]
         }
 
-        if self.selected_level_index is not None:
-            self.levels[self.selected_level_index] = level_data
-        else:
-            self.levels.append(level_data)
-
-        with open(self.levels_path, 'w') as f:
-            json.dump(self.levels, f, indent=4)
-        logging.info("Level saved successfully")
+        # Only this level is written, as one record in the level store's journal
+        index = self.selected_level_index if self.selected_level_index is not None else len(self.levels)
+        self.levels.save(index, level_data)
+        logger.info("Level saved successfully")
 
     def draw_grid(self):
         for x in range(0, self.screen.width, self.block_size):
@@ -121,26 +117,22 @@ class LevelEditor:
         self.screen.draw_border()
 
     def draw_instructions(self):
-        instructions = [
+        instructions = (
             "LMB: Place Block/Change Movability/Place Teleport",
             "RMB: Remove Object",
             "1, 2, 3: Place Player, Key, Door",
             "T: Toggle Teleport Placement",
             "S: Save Level"
-        ]
-        font = pygame.font.SysFont("monospace", 14)
-        for i, instruction in enumerate(instructions):
-            instruction_text = font.render(instruction, True, Color.WHITE)
-            self.screen.screen.blit(instruction_text, (10, 3 + i * 15))
+        )
+        self.screen.screen.blit(render_lines(instructions, 14, Color.WHITE, 15), (10, 3))
 
     def draw_dropdown_menu(self):
-        font = pygame.font.SysFont("monospace", 18)
         pygame.draw.rect(self.screen.screen, Color.DARK_GRAY, self.dropdown_rect)
         
         if self.selected_level_index is not None:
-            dropdown_text = font.render(f"Level {self.selected_level_index + 1}", True, Color.WHITE)
+            dropdown_text = render_text(f"Level {self.selected_level_index + 1}", 18, Color.WHITE)
         else:
-            dropdown_text = font.render("Select Level", True, Color.WHITE)
+            dropdown_text = render_text("Select Level", 18, Color.WHITE)
         
         text_rect = dropdown_text.get_rect(center=self.dropdown_rect.center)
         self.screen.screen.blit(dropdown_text, text_rect.topleft)
@@ -149,7 +141,7 @@ class LevelEditor:
             for i, rect in enumerate(self.dropdown_items):
                 color = Color.GREEN if i == self.selected_level_index else Color.DARK_GRAY
                 pygame.draw.rect(self.screen.screen, color, rect)
-                item_text = font.render(f"Level {i + 1}", True, Color.WHITE)
+                item_text = render_text(f"Level {i + 1}", 18, Color.WHITE)
                 self.screen.screen.blit(item_text, rect.topleft)
 
     def add_teleport_pair(self, x1, y1, x2, y2):
@@ -157,7 +149,7 @@ class LevelEditor:
         self.teleports.append(teleport_pair)
 
     def draw_elements(self):
-        logging.debug("Drawing elements on screen")
+        logger.debug("Drawing elements on screen")
         self.screen.refresh_background()
         for block in self.blocks:
             block.draw(self.screen.screen)
@@ -178,30 +170,30 @@ class LevelEditor:
         for block in self.blocks:
             if block.rect.collidepoint(x, y):
                 self.blocks.remove(block)
-                logging.info(f"Removed block at ({x}, {y})")
+                logger.debug("Removed block at (%d, %d)", x, y)
                 break
         if self.player_start and self.player_start.rect.collidepoint(x, y):
             self.history.append(('player', self.player_start))
             self.player_start = None
-            logging.info("Removed player start position")
+            logger.debug("Removed player start position")
         if self.key_start and self.key_start.rect.collidepoint(x, y):
             self.history.append(('key', self.key_start))
             self.key_start = None
-            logging.info("Removed key start position")
+            logger.debug("Removed key start position")
         if self.door_start and self.door_start.rect.collidepoint(x, y):
             self.history.append(('door', self.door_start))
             self.door_start = None
-            logging.info("Removed door start position")
+            logger.debug("Removed door start position")
         if self.teleports:
             for teleport in self.teleports:
                 if teleport.teleport1.rect.collidepoint(x, y) or teleport.teleport2.rect.collidepoint(x, y):
                     self.history.append(('teleport', teleport))
                     self.teleports.remove(teleport)
-                    logging.info("Removed teleport pair")
+                    logger.debug("Removed teleport pair")
                     return
 
     def run(self):
-        logging.info("Starting LevelEditor run loop")
+        logger.info("Starting LevelEditor run loop")
         running = True
         redraw_needed = True  # Flag to track if redraw is needed
         placing_teleport = False
@@ -210,16 +202,16 @@ class LevelEditor:
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    logging.info("Received QUIT event")
+                    logger.info("Received QUIT event")
                     running = False
                 elif event.type == pygame.MOUSEBUTTONDOWN:
-                    logging.info(f"Mouse button down at position: {event.pos}")
+                    logger.debug("Mouse button down at position: %s", event.pos)
                     if self.return_button_rect.collidepoint(event.pos):
-                        logging.info("Return button clicked")
+                        logger.info("Return button clicked")
                         running = False
                     elif self.dropdown_rect.collidepoint(event.pos):
                         self.dropdown_open = not self.dropdown_open
-                        logging.info(f"Dropdown menu {'opened' if self.dropdown_open else 'closed'}")
+                        logger.debug("Dropdown menu %s", "opened" if self.dropdown_open else "closed")
                         redraw_needed = True
                     elif self.dropdown_open:
                         for i, rect in enumerate(self.dropdown_items):
@@ -227,7 +219,7 @@ class LevelEditor:
                                 self.selected_level_index = i
                                 self.load_level(i)
                                 self.dropdown_open = False
-                                logging.info(f"Selected level {i}")
+                                logger.info("Selected level %d", i)
                                 redraw_needed = True
                                 break
                     else:
@@ -238,10 +230,10 @@ class LevelEditor:
                             if placing_teleport:
                                 if teleport_start_pos is None:
                                     teleport_start_pos = (x, y)
-                                    logging.info(f"Teleport start position set at ({x}, {y})")
+                                    logger.debug("Teleport start position set at (%d, %d)", x, y)
                                 else:
                                     self.add_teleport_pair(teleport_start_pos[0], teleport_start_pos[1], x, y)
-                                    logging.info(f"Placed teleport pair from ({teleport_start_pos[0]}, {teleport_start_pos[1]}) to ({x}, {y})")
+                                    logger.debug("Placed teleport pair from (%d, %d) to (%d, %d)", teleport_start_pos[0], teleport_start_pos[1], x, y)
                                     teleport_start_pos = None
                                     placing_teleport = False
                                 redraw_needed = True
@@ -249,12 +241,12 @@ class LevelEditor:
                                 for block in self.blocks:
                                     if block.rect.collidepoint(x, y):
                                         block.change_movability()
-                                        logging.info(f"Changed movability of block at ({x}, {y})")
+                                        logger.debug("Changed movability of block at (%d, %d)", x, y)
                                         break
                                 else:
                                     new_block = Block(x, y, self.block_size, self.block_size)
                                     self.blocks.append(new_block)
-                                    logging.info(f"Placed new block at ({x}, {y})")
+                                    logger.debug("Placed new block at (%d, %d)", x, y)
                                 redraw_needed = True
                         elif event.button == 3:  # Right click to remove object
                             self.remove_object(x, y)
@@ -265,30 +257,34 @@ class LevelEditor:
                     y = (y // self.block_size) * self.block_size
                     if event.key == pygame.K_1:  # Press '1' to place player
                         self.player_start = Player(x, y, self.block_size, self.block_size)
-                        logging.info(f"Placed player start at ({x}, {y})")
+                        logger.debug("Placed player start at (%d, %d)", x, y)
                         redraw_needed = True
                     elif event.key == pygame.K_2:  # Press '2' to place key
                         self.key_start = Key(x, y, self.block_size, self.block_size)
-                        logging.info(f"Placed key start at ({x}, {y})")
+                        logger.debug("Placed key start at (%d, %d)", x, y)
                         redraw_needed = True
                     elif event.key == pygame.K_3:  # Press '3' to place door
                         self.door_start = Door(x, y, self.block_size, self.block_size)
-                        logging.info(f"Placed door start at ({x}, {y})")
+                        logger.debug("Placed door start at (%d, %d)", x, y)
                         redraw_needed = True
                     elif event.key == pygame.K_t:  # Press 'T' to toggle teleport placement mode
                         placing_teleport = not placing_teleport
                         teleport_start_pos = None
-                        logging.info(f"Teleport placement mode {'enabled' if placing_teleport else 'disabled'}")
+                        logger.debug("Teleport placement mode %s", "enabled" if placing_teleport else "disabled")
                     elif event.key == pygame.K_s:  # Press 's' to save the level
                         self.save_level()
                     elif event.key == pygame.K_z:  # Press 'z' to undo the last action
                         self.undo_last_action()
                         redraw_needed = True
                     elif event.key == pygame.K_ESCAPE:
-                        logging.info("Return button clicked")
+                        logger.info("Return button clicked")
                         running = False
 
             if redraw_needed:
                 self.draw_elements()
                 redraw_needed = False
+            if running:
+                wait_for_input()
+        # Fold this session's saves back into the levels file
+        self.levels.store.compact_in_background()
         self.screen.display_menu()
\ No newline at end of file
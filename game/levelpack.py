@@ -0,0 +1,163 @@
+import os
+import mmap
+import json
+import struct
+import argparse
+
+# Level pack layout, all little-endian:
+#   header   "PZLP", u16 version, u16 unit (pixels per grid cell), u32 level count
+#   offsets  u32 file offset of every level record, plus one for the end of the last record
+#   records  u8 kind, then either
+#            PACKED: u8 x/y cells of player, key and door, u16 block count, u8 teleport pair count,
+#                    u8 x/y cell per block, can_move bits (lowest bit first), u8 x1/y1/x2/y2 per pair
+#            RAW:    the level as UTF-8 JSON, for levels that do not fit the packed form
+MAGIC = b"PZLP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+PACKED, RAW = 0, 1
+LEVEL_KEYS = {"player_start", "key_start", "door_start", "blocks", "teleports"}
+
+
+def _cell(value, unit):
+    if isinstance(value, int) and not isinstance(value, bool) and value % unit == 0 and 0 <= value // unit <= 255:
+        return value // unit
+    return None
+
+
+def _packable(level_data, unit):
+    if not isinstance(level_data, dict) or set(level_data) != LEVEL_KEYS:
+        return False
+    points = [level_data["player_start"], level_data["key_start"], level_data["door_start"]]
+    for block in level_data["blocks"]:
+        if len(block) != 5 or not isinstance(block[4], bool) or block[2:4] != [unit, unit]:
+            return False
+        points.append(block[:2])
+    for teleport in level_data["teleports"]:
+        if len(teleport) != 2:
+            return False
+        for pad in teleport:
+            if len(pad) != 4 or pad[2:] != [unit, unit]:
+                return False
+            points.append(pad[:2])
+    if len(level_data["blocks"]) > 0xFFFF or len(level_data["teleports"]) > 0xFF:
+        return False
+    return all(len(point) == 2 and _cell(point[0], unit) is not None and _cell(point[1], unit) is not None
+               for point in points)
+
+
+def encode_level(level_data, unit=80):
+    if not _packable(level_data, unit):
+        return bytes([RAW]) + json.dumps(level_data, separators=(",", ":")).encode()
+    blocks = level_data["blocks"]
+    teleports = level_data["teleports"]
+    record = bytearray([PACKED])
+    for name in ("player_start", "key_start", "door_start"):
+        record += bytes(value // unit for value in level_data[name])
+    record += struct.pack("<HB", len(blocks), len(teleports))
+    for block in blocks:
+        record += bytes((block[0] // unit, block[1] // unit))
+    flags = bytearray((len(blocks) + 7) // 8)
+    for i, block in enumerate(blocks):
+        if block[4]:
+            flags[i // 8] |= 1 << (i % 8)
+    record += flags
+    for teleport in teleports:
+        record += bytes(value // unit for pad in teleport for value in pad[:2])
+    return bytes(record)
+
+
+def decode_level(record, unit=80):
+    if record[0] == RAW:
+        return json.loads(bytes(record[1:]))
+    player, key, door = record[1:3], record[3:5], record[5:7]
+    block_count, teleport_count = struct.unpack_from("<HB", record, 7)
+    position = 10
+    cells = record[position:position + 2 * block_count]
+    position += 2 * block_count
+    flags = record[position:position + (block_count + 7) // 8]
+    position += len(flags)
+    pads = record[position:position + 4 * teleport_count]
+    return {
+        "player_start": [player[0] * unit, player[1] * unit],
+        "key_start": [key[0] * unit, key[1] * unit],
+        "door_start": [door[0] * unit, door[1] * unit],
+        "blocks": [[cells[2 * i] * unit, cells[2 * i + 1] * unit, unit, unit, bool(flags[i // 8] >> (i % 8) & 1)]
+                   for i in range(block_count)],
+        "teleports": [[[pads[4 * i] * unit, pads[4 * i + 1] * unit, unit, unit],
+                       [pads[4 * i + 2] * unit, pads[4 * i + 3] * unit, unit, unit]]
+                      for i in range(teleport_count)],
+    }
+
+
+def write_pack(levels_data, file_path, unit=80):
+    records = [encode_level(level_data, unit) for level_data in levels_data]
+    offset = HEADER.size + 4 * (len(records) + 1)
+    offsets = []
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    offsets.append(offset)
+    with open(file_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, unit, len(records)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for record in records:
+            f.write(record)
+        # Callers rename the file over a pack that holds levels, it has to be on disk first
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def is_pack(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class LevelPack:
+    # Read-only view of a pack file. Only the header is read up front, levels are decoded on access.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.unit, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError(f"{file_path} is not a version {VERSION} level pack")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError("level index out of range")
+        index %= self.count
+        start, end = struct.unpack_from("<II", self.buffer, HEADER.size + 4 * index)
+        return decode_level(self.buffer[start:end], self.unit)
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def close(self):
+        self.buffer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert levels between JSON and the binary level pack")
+    parser.add_argument("source", help="levels.json or level pack")
+    parser.add_argument("target", help="output file, the format is the other one of the source")
+    args = parser.parse_args()
+
+    if is_pack(args.source):
+        pack = LevelPack(args.source)
+        levels_data = list(pack)
+        pack.close()
+        with open(args.target, 'w') as f:
+            json.dump(levels_data, f, indent=4)
+    else:
+        with open(args.source, 'r') as f:
+            levels_data = json.load(f)
+        write_pack(levels_data, args.target)
+    print(f"Converted {len(levels_data)} levels from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
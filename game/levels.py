@@ -1,22 +1,153 @@
 import os
 import json
-from game.block import Block
+import hashlib
+import logging
 from game.level import Level
-from game.teleport import TeleportPair
+from game.simulation import Board
+from game.levelpack import LevelPack, is_pack
+from game.levelstore import LevelStore
 
-def load_levels_from_json(file_path):
+logger = logging.getLogger(__name__)
+
+def load_levels_data(file_path):
+    if is_pack(file_path):
+        pack = LevelPack(file_path)
+        levels_data = list(pack)
+        pack.close()
+        return levels_data
     with open(file_path, 'r') as f:
-        levels_data = json.load(f)
-
-    levels = []
-    for level_data in levels_data:
-        player_start = tuple(level_data["player_start"])
-        key_start = tuple(level_data["key_start"])
-        door_start = tuple(level_data["door_start"])
-        blocks = [Block(*block) for block in level_data["blocks"]]
-        teleports = [TeleportPair(teleport[0][0], teleport[0][1], teleport[1][0], teleport[1][1], 80, 80) for teleport in level_data.get("teleports", [])]
-        levels.append(Level(player_start, key_start, door_start, blocks, teleports))
-    return levels
+        return json.load(f)
+
+def build_level(level_data):
+    # Entity classes load their images, keep them out of headless imports of this module
+    from game.block import Block
+    from game.teleport import TeleportPair
+
+    player_start = tuple(level_data["player_start"])
+    key_start = tuple(level_data["key_start"])
+    door_start = tuple(level_data["door_start"])
+    blocks = [Block(*block) for block in level_data["blocks"]]
+    teleports = [TeleportPair(teleport[0][0], teleport[0][1], teleport[1][0], teleport[1][1], 80, 80) for teleport in level_data.get("teleports", [])]
+    return Level(player_start, key_start, door_start, blocks, teleports)
+
+def load_levels_from_json(file_path):
+    return [build_level(level_data) for level_data in load_levels_data(file_path)]
+
+def levels_file(path):
+    return os.path.join(os.path.dirname(__file__), path)
 
 def create_levels(path):
-    return load_levels_from_json(os.path.join(os.path.dirname(__file__), path))
\ No newline at end of file
+    return load_levels_from_json(levels_file(path))
+
+def create_levels_data(path):
+    return load_levels_data(levels_file(path))
+
+def level_hash(level_data):
+    return hashlib.sha1(json.dumps(level_data, sort_keys=True).encode()).hexdigest()
+
+
+class LevelRepository:
+    # Reads the level store (levels file, JSON or binary level pack, plus its save journal) once and again
+    # only when a file changes. A grown journal is applied from where the last read stopped.
+    # Boards are cached per index along with the level's content hash, so after a reload only the entries
+    # that changed are rebuilt and a changed entry replaces its stale board.
+    # Entities are built per request: the game moves their rects, so a Level is never shared.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.store = LevelStore(file_path)
+        self.mtime = None
+        self.file_hash = None
+        self.base = []
+        self.saved = {}
+        self.count = 0
+        self.journal = None
+        self.journal_offset = 0
+        self.hashes = {}
+        self.boards = {}
+        self.refresh()
+
+    def refresh(self):
+        with self.store.lock:
+            journal, journal_size = self.store.journal_stat()
+            try:
+                mtime = os.stat(self.file_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self.mtime and journal == self.journal and journal_size == self.journal_offset:
+                return False
+            if mtime != self.mtime or journal != self.journal or journal_size < self.journal_offset:
+                # Journal first: a compaction swaps the levels file before it truncates the journal
+                self.journal = journal
+                records, self.journal_offset = self.store.read_journal()
+                base_changed = self.load_base(mtime)
+                if not base_changed and not records and not self.saved:
+                    return False
+                self.saved = {}
+                self.count = len(self.base)
+            else:
+                records, self.journal_offset = self.store.read_journal(self.journal_offset)
+            for index, level_data in records:
+                index = min(index, self.count)
+                self.saved[index] = level_data
+                self.count = max(self.count, index + 1)
+            self.hashes = {}
+            # Levels past the end are gone, the others are checked against their hash when asked for
+            for index in [index for index in self.boards if index >= self.count]:
+                del self.boards[index]
+            logger.info("Loaded %d levels from %s", self.count, self.file_path)
+            return True
+
+    def load_base(self, mtime):
+        self.mtime = mtime
+        if mtime is None:
+            self.base = []
+            self.file_hash = None
+            return True
+        if is_pack(self.file_path):
+            # Packs are memory-mapped and decoded per level, there is nothing to parse up front
+            if isinstance(self.base, LevelPack):
+                self.base.close()
+            self.base = LevelPack(self.file_path)
+            self.file_hash = None
+            return True
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+        file_hash = hashlib.sha1(content).hexdigest()
+        if file_hash == self.file_hash:
+            return False
+        self.file_hash = file_hash
+        self.base = json.loads(content)
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return build_level(self.data(index))
+
+    def data(self, index):
+        if index < 0:
+            index += self.count
+        if index in self.saved:
+            return self.saved[index]
+        if not 0 <= index < self.count:
+            raise IndexError("level index out of range")
+        return self.base[index]
+
+    def save(self, index, level_data):
+        self.store.save(index, level_data)
+        self.refresh()
+
+    def level_hash(self, index):
+        if index not in self.hashes:
+            self.hashes[index] = level_hash(self.data(index))
+        return self.hashes[index]
+
+    def board(self, index, grid_size=10, block_size=80):
+        if index < 0:
+            index += self.count
+        key = (self.level_hash(index), grid_size, block_size)
+        cached = self.boards.get(index)
+        if cached is None or cached[0] != key:
+            cached = self.boards[index] = (key, Board.from_level_data(self.data(index), grid_size, block_size))
+        return cached[1]
@@ -0,0 +1,142 @@
+import os
+import json
+import logging
+import threading
+from game.levelpack import LevelPack, is_pack, write_pack
+
+logger = logging.getLogger(__name__)
+
+# Journal records written before a background compaction folds them into the levels file
+COMPACT_AFTER = 32
+
+
+def sync_directory(file_path):
+    # Makes renames in the directory of file_path durable. Not every platform can open a directory,
+    # those get no stronger guarantee than the rename itself.
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class LevelStore:
+    # A levels file (JSON or level pack) plus an append-only journal next to it. Saving a level appends one
+    # "set level i" record and fsyncs it, an index past the end appends the level. Compaction folds the journal
+    # back into the levels file with atomic renames. Records are idempotent, so a crash at any point replays
+    # to the same levels.
+    def __init__(self, file_path, compact_after=COMPACT_AFTER):
+        self.file_path = file_path
+        self.journal_path = file_path + ".journal"
+        self.compact_after = compact_after
+        self.lock = threading.RLock()
+        self.compactor = None
+
+    def read_base(self):
+        if not os.path.exists(self.file_path):
+            return []
+        if is_pack(self.file_path):
+            return LevelPack(self.file_path)
+        with open(self.file_path, 'r') as f:
+            return json.load(f)
+
+    def read_journal(self, offset=0):
+        # Only complete lines count, a torn last record from a crash is left for the next append to skip
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                content = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = content.rfind(b"\n") + 1
+        records = []
+        for line in content[:end].splitlines():
+            try:
+                record = json.loads(line)
+                records.append((record["index"], record["level"]))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping damaged record in %s", self.journal_path)
+        return records, offset + end
+
+    def journal_stat(self):
+        # Compaction replaces the journal, so the inode tells a swapped journal from a grown one
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def save(self, index, level_data):
+        line = json.dumps({"index": index, "level": level_data}, separators=(",", ":")).encode() + b"\n"
+        with self.lock:
+            with open(self.journal_path, 'ab') as f:
+                # A previous crash may have left half a record, start ours on a fresh line
+                if f.tell() and not self._ends_with_newline():
+                    f.write(b"\n")
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            pending = len(self.read_journal()[0])
+        if pending >= self.compact_after:
+            self.compact_in_background()
+
+    def _ends_with_newline(self):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def compact_in_background(self):
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self.compact, name="level-compaction", daemon=True)
+        self.compactor.start()
+
+    def compact(self):
+        with self.lock:
+            records, end = self.read_journal()
+            if not records:
+                return
+            base = self.read_base()
+            levels_data = list(base)
+            pack = isinstance(base, LevelPack)
+            if pack:
+                base.close()
+        for index, level_data in records:
+            if index < len(levels_data):
+                levels_data[index] = level_data
+            else:
+                levels_data.append(level_data)
+
+        temporary = self.file_path + ".tmp"
+        if pack:
+            write_pack(levels_data, temporary)
+        else:
+            with open(temporary, 'w') as f:
+                json.dump(levels_data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self.lock:
+            # The new levels file goes in first: until the journal is swapped too, replaying it is harmless
+            os.replace(temporary, self.file_path)
+            # The rename has to be on disk before the journal that would redo it shrinks
+            sync_directory(self.file_path)
+            with open(self.journal_path, 'rb') as f:
+                f.seek(end)
+                remainder = f.read()
+            with open(self.journal_path + ".tmp", 'wb') as f:
+                f.write(remainder)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.journal_path + ".tmp", self.journal_path)
+            sync_directory(self.journal_path)
+        logger.info("Compacted %d saved levels into %s", len(records), self.file_path)
+
+    def wait(self):
+        if self.compactor is not None:
+            self.compactor.join()
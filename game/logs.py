@@ -0,0 +1,75 @@
+import sys
+import queue
+import atexit
+import logging
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LEVEL = "INFO"
+# Records the browser build keeps, the newest ones win
+RING_SIZE = 1000
+
+ring = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    # QueueHandler formats the message in the logging thread before queueing it. The listener lives in
+    # the same process, so the record can go over as it is and be formatted on the listener thread.
+    def prepare(self, record):
+        return record
+
+
+class RingBufferHandler(logging.Handler):
+    # Console writes are synchronous in the browser. Keep the newest records and format them on request.
+    def __init__(self, capacity=RING_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def lines(self):
+        return [self.format(record) for record in list(self.records)]
+
+
+def parse_levels(specs):
+    # "screen=DEBUG" or "game.screen=DEBUG" -> {"game.screen": "DEBUG"}
+    levels = {}
+    for spec in specs or ():
+        name, _, level = spec.partition("=")
+        if not level:
+            raise ValueError(f"Expected SUBSYSTEM=LEVEL, got {spec!r}")
+        if name != "game" and not name.startswith("game."):
+            name = "game." + name
+        levels[name] = level.upper()
+    return levels
+
+
+def configure_logging(level=DEFAULT_LEVEL, levels=None):
+    # Called once by the entry point. Modules only create loggers, so importing them has no side effects.
+    global ring
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    formatter = logging.Formatter(FORMAT)
+    if sys.platform == "emscripten":
+        ring = RingBufferHandler()
+        ring.setFormatter(formatter)
+        root.addHandler(ring)
+    else:
+        records = queue.SimpleQueue()
+        output = logging.StreamHandler()
+        output.setFormatter(formatter)
+        listener = QueueListener(records, output)
+        listener.start()
+        atexit.register(listener.stop)
+        root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level.upper())
+    for name, subsystem_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+
+def recent_logs():
+    # Formatted lines of the browser build's ring buffer
+    return ring.lines() if ring is not None else []
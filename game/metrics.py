@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from array import array
+from collections import deque
+from game.levels import LevelRepository, level_hash, levels_file
+from game.simulation import Board, Simulation, DIRECTIONS
+from game.solver import solve_level, DEFAULT_MAX_STATES
+
+INDEX_VERSION = 2
+DEFAULT_TIMEOUT = 120.0
+# Positions explored for the reachable state count before it is reported as a lower bound
+REACHABLE_LIMIT = 200_000
+# Reachable positions that count towards difficulty; the score grows with their logarithm, and counting
+# stops here so that rating a level stays cheap
+DIFFICULTY_REACHABLE = 10_000
+# Difficulty scores at which the 1-5 rating goes up a step
+RATING_STEPS = (3.0, 5.5, 7.0, 9.0)
+
+
+def metrics_file(levels_path):
+    return levels_path + ".metrics"
+
+
+def reachable_states(board, limit=REACHABLE_LIMIT):
+    # Distinct positions reachable with moves alone. What a move does never depends on the undo
+    # stacks, so every position is expanded from empty stacks; won positions end the level.
+    simulation = Simulation(board)
+    empty = tuple(array('h') for _ in range(3 + len(board.block_starts)))
+    start = (simulation.player, simulation.key, simulation.door, simulation.door_open, tuple(simulation.blocks))
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        for direction in DIRECTIONS:
+            simulation.restore(state + (empty,))
+            simulation.move(direction)
+            child = (simulation.player, simulation.key, simulation.door, simulation.door_open, tuple(simulation.blocks))
+            if child in seen:
+                continue
+            seen.add(child)
+            if len(seen) >= limit:
+                return len(seen), False
+            if not simulation.won:
+                queue.append(child)
+    return len(seen), True
+
+
+def difficulty(length, undos, reachable):
+    # Rough score: long solutions, solutions that lean on undo and many reachable positions make a level
+    # harder. All three are properties of the level, not of the machine or the solver's limits.
+    if length is None:
+        return None, None
+    reachable = min(max(reachable, 1), DIFFICULTY_REACHABLE)
+    score = round(length / 10 + undos + math.log10(reachable) / 2, 2)
+    return score, 1 + sum(score >= step for step in RATING_STEPS)
+
+
+def settled(entry):
+    # Proven results do not depend on the machine or the limits; anything else is measured again
+    return entry["status"] == "unsolvable" or entry["par_optimal"]
+
+
+def better(entry, previous):
+    # A new measurement replaces the old one unless it knows less: no par where there was one, or a
+    # longer par without proof
+    if previous is None or settled(entry):
+        return True
+    if previous["par"] is None:
+        return True
+    return entry["par"] is not None and entry["par"] < previous["par"]
+
+
+def level_metrics(level_data, timeout=DEFAULT_TIMEOUT, max_states=DEFAULT_MAX_STATES):
+    board = Board.from_level_data(level_data)
+    interior = sum(board.interior[:board.size])
+    occupied = {board.player_start, board.key_start, board.door_start, *board.block_starts}
+    reachable, complete = reachable_states(board)
+    result = solve_level(level_data, None, max_states, timeout)
+    undos = result.moves.count("z") if result.solved else None
+    score, rating = difficulty(result.length, undos or 0, reachable)
+    return {
+        "occupied_cells": len(occupied),
+        "occupancy": round(len(occupied) / interior, 3),
+        "blocks": len(board.block_starts),
+        "movable_blocks": sum(board.movable),
+        "teleports": len(board.teleports),
+        "reachable_states": reachable,
+        "reachable_complete": complete,
+        "status": result.status,
+        "par": result.length,
+        "par_optimal": result.optimal,
+        "undos_in_solution": undos,
+        "search_states": result.states,
+        "difficulty": score,
+        "rating": rating,
+    }
+
+
+class MetricsIndex:
+    # Per-level metrics on disk, keyed by level content hash so that edited or reordered levels keep
+    # or lose their entries on their own. Built offline (python -m game.metrics), the game only reads it
+    # and re-reads it when the file changes.
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.mtime = None
+        self.metrics = {}
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        self.metrics = {}
+        if mtime is not None:
+            with open(self.file_path, 'r') as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                self.metrics = index["levels"]
+        return True
+
+    def get(self, content_hash):
+        return self.metrics.get(content_hash)
+
+    def missing(self, hashes):
+        # Levels not measured yet, and levels whose par is only the best known so far
+        return [content_hash for content_hash in dict.fromkeys(hashes)
+                if content_hash not in self.metrics or not settled(self.metrics[content_hash])]
+
+    def update(self, levels_data, workers=None, timeout=DEFAULT_TIMEOUT, max_states=DEFAULT_MAX_STATES):
+        # Measures only levels whose content is not in the index yet and drops entries of levels that are gone
+        hashes = [level_hash(level_data) for level_data in levels_data]
+        by_hash = dict(zip(hashes, levels_data))
+        self.metrics = {content_hash: entry for content_hash, entry in self.metrics.items() if content_hash in by_hash}
+        missing = self.missing(hashes)
+        if missing:
+            # Only the offline build measures, the game itself never needs worker processes
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(level_metrics, by_hash[content_hash], timeout, max_states): content_hash
+                           for content_hash in missing}
+                for future in as_completed(futures):
+                    content_hash = futures[future]
+                    entry = future.result()
+                    if better(entry, self.metrics.get(content_hash)):
+                        self.metrics[content_hash] = entry
+                    yield content_hash
+        self.save()
+
+    def save(self):
+        # Runs that ran out of time or states before any solution tell nothing and are not kept; a par
+        # without proof is kept as the best known one until a later run improves or proves it
+        levels = {content_hash: entry for content_hash, entry in self.metrics.items()
+                  if settled(entry) or entry["par"] is not None}
+        temporary = self.file_path + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump({"version": INDEX_VERSION, "levels": levels}, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.file_path)
+        self.mtime = os.stat(self.file_path).st_mtime_ns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the level metrics index the Levels menu reads")
+    parser.add_argument("levels", nargs="?", help="levels file, defaults to data/levels.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="solver seconds per level")
+    parser.add_argument("--max-states", type=int, default=DEFAULT_MAX_STATES)
+    args = parser.parse_args()
+
+    levels_path = args.levels or levels_file("../data/levels.json")
+    levels = LevelRepository(levels_path)
+    levels_data = [levels.data(i) for i in range(len(levels))]
+    index = MetricsIndex(metrics_file(levels_path))
+    start = time.perf_counter()
+    measured = 0
+    for content_hash in index.update(levels_data, args.workers, args.timeout or None, args.max_states):
+        measured += 1
+        entry = index.get(content_hash)
+        print(json.dumps({"hash": content_hash, **entry}), flush=True)
+    print(f"Measured {measured} of {len(levels_data)} levels in {time.perf_counter() - start:.2f}s, "
+          f"index at {index.file_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+# At most one write per interval, later saves in between only replace the pending session
+SAVE_INTERVAL = 0.5
+STORAGE_KEY = "session"
+# Separate localStorage keys of older browser builds, read once and then replaced by the single blob
+LEGACY_KEYS = ("current_level_index", "total_moves", "total_undos", "total_resets", "elapsed_time")
+SESSION_FILE = os.path.join(os.path.expanduser("~"), ".puzzlegame", "session.json")
+
+
+class BrowserStorage:
+    # One localStorage item holding the whole session
+    def read(self):
+        from js import window
+        text = window.localStorage.getItem(STORAGE_KEY)
+        if text is not None:
+            return json.loads(text)
+        if window.localStorage.getItem("current_level_index") is None:
+            return None
+        values = [window.localStorage.getItem(key) for key in LEGACY_KEYS]
+        return {
+            "version": SESSION_VERSION,
+            "current_level_index": int(values[0]),
+            "total_moves": int(values[1] or 0),
+            "total_undos": int(values[2] or 0),
+            "total_resets": int(values[3] or 0),
+            "elapsed_time": float(values[4] or 0),
+        }
+
+    def write(self, text):
+        from js import window
+        window.localStorage.setItem(STORAGE_KEY, text)
+
+    def remove(self):
+        from js import window
+        window.localStorage.removeItem(STORAGE_KEY)
+        for key in LEGACY_KEYS:
+            window.localStorage.removeItem(key)
+
+    def wait(self):
+        pass
+
+
+class FileStorage:
+    # Session file written by a background thread: a temporary file, fsync, then an atomic rename, so a
+    # crash leaves either the old session or the new one. Only the newest pending write is kept.
+    REMOVE = object()
+
+    def __init__(self, file_path=SESSION_FILE):
+        self.file_path = file_path
+        self.condition = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.writer = None
+
+    def read(self):
+        self.wait()
+        try:
+            with open(self.file_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ignoring unreadable session file %s", self.file_path)
+            return None
+
+    def write(self, text):
+        self._submit(text)
+
+    def remove(self):
+        self._submit(self.REMOVE)
+
+    def _submit(self, item):
+        with self.condition:
+            self.pending = item
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._run, name="session-writer", daemon=True)
+                self.writer.start()
+            self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while self.pending is not None or self.busy:
+                self.condition.wait()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                item, self.pending = self.pending, None
+                self.busy = True
+            try:
+                if item is self.REMOVE:
+                    self._remove()
+                else:
+                    self._write(item)
+            except OSError as error:
+                logger.error("Could not save the session to %s: %s", self.file_path, error)
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+    def _write(self, text):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        temporary = self.file_path + ".tmp"
+        with open(temporary, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.file_path)
+
+    def _remove(self):
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
+
+class MemoryStorage:
+    # Keeps the session for this process only, for benchmarks and headless runs
+    def __init__(self):
+        self.text = None
+
+    def read(self):
+        return json.loads(self.text) if self.text is not None else None
+
+    def write(self, text):
+        self.text = text
+
+    def remove(self):
+        self.text = None
+
+    def wait(self):
+        pass
+
+
+def default_storage():
+    return BrowserStorage() if sys.platform == "emscripten" else FileStorage()
+
+
+class SessionStore:
+    # Coalesces the game's saves: the session is serialized into one blob and written at most once per
+    # interval. flush() writes a pending session straight away, for level changes and quitting.
+    def __init__(self, storage, interval=SAVE_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self.pending = None
+        self.last_write = 0.0
+        self.saved = None
+
+    def load(self):
+        self.flush()
+        try:
+            session = self.storage.read()
+        except (ValueError, TypeError):
+            logger.warning("Ignoring unreadable saved session")
+            self.saved = False
+            return None
+        if session is None or session.get("version") != SESSION_VERSION:
+            self.saved = False
+            return None
+        self.saved = True
+        return session
+
+    def exists(self):
+        if self.saved is None:
+            self.load()
+        return self.saved
+
+    def save(self, session):
+        self.pending = dict(session, version=SESSION_VERSION)
+        self.tick()
+
+    def tick(self):
+        if self.pending is not None and time.perf_counter() - self.last_write >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return
+        session, self.pending = self.pending, None
+        self.storage.write(json.dumps(session, separators=(",", ":")))
+        self.last_write = time.perf_counter()
+        self.saved = True
+        logger.debug("Saved session at level %d", session["current_level_index"] + 1)
+
+    def clear(self):
+        self.pending = None
+        self.saved = False
+        self.storage.remove()
+
+    def close(self):
+        self.flush()
+        self.storage.wait()
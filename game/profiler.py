@@ -0,0 +1,135 @@
+import csv
+import json
+import time
+from collections import deque
+
+# Frames kept for the overlay and the export, older ones are dropped first
+MAX_FRAMES = 10000
+# Frames the overlay averages over
+OVERLAY_FRAMES = 60
+PHASES = ("events", "rules", "shake", "save", "search", "render", "present", "wait")
+# Phases measured inside another one, reported apart from it
+NESTED = (("rules", "events"), ("shake", "events"), ("save", "events"), ("present", "render"))
+
+
+def phase_times(spans):
+    # Exclusive seconds per phase of one frame
+    times = dict.fromkeys(PHASES, 0.0)
+    for phase, start, end in spans:
+        times[phase] += end - start
+    for child, parent in NESTED:
+        times[parent] -= times[child]
+    return times
+
+
+class FrameProfiler:
+    # Splits every level frame into phases: event handling, the rules update, undo shakes, saving,
+    # the dead end search, drawing, display.update and the wait for the next frame. Key presses are
+    # timed until the frame that handled them is on screen. Records only while enabled (export) or
+    # visible (overlay), so the hooks can stay in the loop.
+    def __init__(self, enabled=False, max_frames=MAX_FRAMES):
+        self.enabled = enabled
+        self.visible = False
+        self.frames = deque(maxlen=max_frames)
+        self.frame_start = None
+        self.last_mark = None
+        self.spans = []
+        self.pressed = []
+        self.latencies = []
+
+    @property
+    def active(self):
+        return self.enabled or self.visible
+
+    def start_frame(self):
+        if not self.active:
+            return
+        self.frame_start = self.last_mark = time.perf_counter()
+        self.spans = []
+        self.latencies = []
+
+    def mark(self, phase):
+        # Everything since the previous mark belongs to phase
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.spans.append((phase, self.last_mark, now))
+        self.last_mark = now
+
+    def span(self, phase, start):
+        if self.frame_start is not None:
+            self.spans.append((phase, start, time.perf_counter()))
+
+    def key_pressed(self):
+        if self.frame_start is not None:
+            self.pressed.append(time.perf_counter())
+
+    def presented(self):
+        if self.pressed:
+            now = time.perf_counter()
+            self.latencies += [(pressed, now) for pressed in self.pressed]
+            self.pressed = []
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.frames.append((self.frame_start, self.spans, self.latencies))
+        self.frame_start = None
+
+    def overlay_lines(self):
+        frames = list(self.frames)[-OVERLAY_FRAMES:]
+        if not frames:
+            return ["profiler: waiting for frames"]
+        totals = dict.fromkeys(PHASES, 0.0)
+        for start, spans, latencies in frames:
+            for phase, seconds in phase_times(spans).items():
+                totals[phase] += seconds
+        average = {phase: 1000 * seconds / len(frames) for phase, seconds in totals.items()}
+        latencies = sorted(1000 * (presented - pressed) for start, spans, frame_latencies in frames
+                           for pressed, presented in frame_latencies)
+        shakes = [1000 * (end - start) for start, spans, latencies in frames
+                  for phase, start, end in spans if phase == "shake"]
+        lines = [
+            f"ms/frame  events {average['events']:.2f}  rules {average['rules']:.2f}  save {average['save']:.2f}  "
+            f"search {average['search']:.2f}",
+            f"render {average['render']:.2f}  present {average['present']:.2f}  wait {average['wait']:.2f}",
+        ]
+        if latencies:
+            lines.append(f"key to screen  p50 {latencies[len(latencies) // 2]:.1f}  max {latencies[-1]:.1f} ms")
+        if shakes:
+            lines.append(f"input blocked by shakes  max {max(shakes):.0f} ms")
+        return lines
+
+    def export(self, file_path):
+        if file_path.endswith(".json"):
+            self.export_trace(file_path)
+        else:
+            self.export_csv(file_path)
+
+    def export_csv(self, file_path):
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start_ms"] + [f"{phase}_ms" for phase in PHASES] + ["keys", "max_key_to_screen_ms"])
+            origin = self.frames[0][0] if self.frames else 0
+            for number, (start, spans, latencies) in enumerate(self.frames):
+                times = phase_times(spans)
+                worst = max((presented - pressed for pressed, presented in latencies), default=None)
+                writer.writerow([number, round(1000 * (start - origin), 3)] +
+                                [round(1000 * times[phase], 3) for phase in PHASES] +
+                                [len(latencies), round(1000 * worst, 3) if worst is not None else ""])
+
+    def export_trace(self, file_path):
+        # Chrome trace event format, for chrome://tracing or Perfetto: frames and phases on one track,
+        # key to screen latencies on a second one
+        origin = self.frames[0][0] if self.frames else 0
+        def event(name, start, end, tid=1):
+            return {"name": name, "ph": "X", "pid": 1, "tid": tid,
+                    "ts": round(1e6 * (start - origin), 1), "dur": round(1e6 * (end - start), 1)}
+        events = []
+        for number, (start, spans, latencies) in enumerate(self.frames):
+            if spans:
+                events.append(event(f"frame {number}", start, spans[-1][2]))
+            events += [event(phase, span_start, span_end) for phase, span_start, span_end in spans]
+            events += [event("key to screen", pressed, presented, 2) for pressed, presented in latencies]
+        with open(file_path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,117 @@
+import time
+import struct
+import hashlib
+from game.journal import MoveJournal
+from game.simulation import Simulation, DIRECTIONS, UNDO
+
+# Replay file layout, all little-endian:
+#   header   "PZRP", u8 version
+#   records  u8 opcode, most of them one byte long:
+#            0-3 move (game.simulation directions), 4 undo, 5 redo, 6 reset level, 7 reset game (ESC)
+#            LEVEL: u16 level index, 20-byte level content hash, u32 moves, undos and resets so far
+#            END:   u32 moves, undos and resets, 20-byte digest of the final state of the last level
+MAGIC = b"PZRP"
+VERSION = 1
+REDO, RESET, RESET_GAME, LEVEL, END = 5, 6, 7, 8, 9
+LEVEL_RECORD = struct.Struct("<H20sIII")
+END_RECORD = struct.Struct("<III20s")
+
+
+def state_digest(simulation):
+    if simulation is None:
+        return bytes(20)
+    state = (simulation.player, simulation.key, simulation.door, simulation.door_open,
+             tuple(simulation.blocks), tuple(stack.tolist() for stack in simulation.history))
+    return hashlib.sha1(repr(state).encode()).digest()
+
+
+class ReplayRecorder:
+    # Every input the game accepted, in order. Level loads carry the level's content hash and the
+    # counters, so a replay can start from a continued game and refuses to run against edited levels.
+    def __init__(self):
+        self.data = bytearray(MAGIC + bytes([VERSION]))
+        self.inputs = 0
+
+    def level(self, index, content_hash, moves, undos, resets):
+        self.data.append(LEVEL)
+        self.data += LEVEL_RECORD.pack(index, bytes.fromhex(content_hash), moves, undos, resets)
+
+    def input(self, code):
+        self.data.append(code)
+        self.inputs += 1
+
+    def finish(self, moves, undos, resets, simulation):
+        return bytes(self.data) + bytes([END]) + END_RECORD.pack(moves, undos, resets, state_digest(simulation))
+
+    def save(self, file_path, moves, undos, resets, simulation):
+        with open(file_path, 'wb') as f:
+            f.write(self.finish(moves, undos, resets, simulation))
+
+
+class ReplayResult:
+    def __init__(self, ok, inputs, elapsed, error=None):
+        self.ok = ok
+        self.inputs = inputs
+        self.elapsed = elapsed
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "ok": self.ok,
+            "inputs": self.inputs,
+            "elapsed": round(self.elapsed, 4),
+            "inputs_per_second": round(self.inputs / self.elapsed) if self.elapsed else None,
+            "error": self.error,
+        }
+
+
+def run_replay(data, levels):
+    # Re-executes a recording against the simulation alone: no window, no rendering, no shakes.
+    # The game's bookkeeping is mirrored so the final counters can be checked too.
+    start = time.perf_counter()
+    if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+        return ReplayResult(False, 0, 0, f"not a version {VERSION} replay")
+    simulation = None
+    moves = undos = resets = inputs = 0
+    position = len(MAGIC) + 1
+    while position < len(data):
+        code = data[position]
+        position += 1
+        if code in DIRECTIONS:
+            if simulation is not None:
+                simulation.move(code)
+            moves += 1
+        elif code == UNDO:
+            if simulation is not None:
+                simulation.undo()
+            undos += 1
+        elif code == REDO:
+            if simulation is not None:
+                simulation.redo()
+        elif code == RESET:
+            if simulation is not None:
+                simulation.reset()
+            resets += 1
+        elif code == RESET_GAME:
+            if simulation is not None:
+                simulation.reset()
+            moves = undos = resets = 0
+        elif code == LEVEL:
+            index, content_hash, moves, undos, resets = LEVEL_RECORD.unpack_from(data, position)
+            position += LEVEL_RECORD.size
+            if index >= len(levels) or levels.level_hash(index) != content_hash.hex():
+                return ReplayResult(False, inputs, time.perf_counter() - start,
+                                    f"level {index + 1} differs from the recorded one")
+            simulation = Simulation(levels.board(index), MoveJournal())
+            continue
+        elif code == END:
+            expected = END_RECORD.unpack_from(data, position)
+            actual = (moves, undos, resets, state_digest(simulation))
+            elapsed = time.perf_counter() - start
+            if actual != expected:
+                return ReplayResult(False, inputs, elapsed, "final state differs from the recorded one")
+            return ReplayResult(True, inputs, elapsed)
+        else:
+            return ReplayResult(False, inputs, time.perf_counter() - start, f"unknown record {code} at byte {position - 1}")
+        inputs += 1
+    return ReplayResult(False, inputs, time.perf_counter() - start, "replay ends without a final state")
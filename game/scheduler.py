@@ -0,0 +1,42 @@
+import sys
+import time
+import asyncio
+import pygame
+
+DEFAULT_FPS = 60
+# Longest stretch an idle desktop loop blocks on input before it runs one more frame
+IDLE_TIMEOUT_MS = 500
+
+
+def wait_for_input(timeout_ms=IDLE_TIMEOUT_MS):
+    # Block until an event arrives and leave it in the queue for the regular pygame.event.get() handlers
+    if pygame.event.peek():
+        return
+    event = pygame.event.wait(timeout_ms)
+    if event.type != pygame.NOEVENT:
+        pygame.event.post(event)
+
+
+class FrameScheduler:
+    def __init__(self, fps=DEFAULT_FPS, idle_timeout_ms=IDLE_TIMEOUT_MS):
+        self.fps = fps
+        self.frame_time = 1 / fps if fps else 0
+        self.idle_timeout_ms = idle_timeout_ms
+        self.last_frame = time.perf_counter()
+        self.frames = 0
+        self.idle_frames = 0
+
+    async def next_frame(self, idle=False):
+        # Idle frames block on input on the desktop. In the browser the loop must hand control back to
+        # the emscripten event loop instead, so it sleeps out the frame there.
+        self.frames += 1
+        if idle:
+            self.idle_frames += 1
+            if sys.platform != "emscripten":
+                wait_for_input(self.idle_timeout_ms)
+                await asyncio.sleep(0)
+                self.last_frame = time.perf_counter()
+                return
+        delay = self.last_frame + self.frame_time - time.perf_counter()
+        await asyncio.sleep(max(delay, 0))
+        self.last_frame = time.perf_counter()
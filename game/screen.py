@@ -1,33 +1,61 @@
 import pygame
 import logging
 import sys
+import time
 from game.color import Color
+from game.text import get_font, render_text, render_lines
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
 class Screen:
     def __init__(self, width=880, height=880, background_color=Color.BLACK, font_type="monospace", font_size=15):
-        logging.info("Initializing screen")
+        logger.info("Initializing screen")
         self.width = width
         self.height = height
         self.background_color = background_color
         self.screen = pygame.display.set_mode((width, height))
-        self.font = pygame.font.SysFont(font_type, font_size)
+        self.font_type = font_type
+        self.font_size = font_size
+        self.font = get_font(font_size, font_type)
         self.grid_size = 10
         self.block_size = min(width, height) // (self.grid_size + 1)
+        # Images drawn on each grid cell in the last level frame, None when the window needs a full redraw
+        self.drawn_cells = None
+        self.drawn_level = None
+        # Background, border, portals and immovable blocks of the current level in one surface
+        self.static_layer = None
+        # Optional FrameProfiler that display updates of level frames are reported to
+        self.profiler = None
+        # (text, color) of a short notice in the top border of level frames: dead end indicator, hints
+        self.status = None
         pygame.display.set_caption("Puzzle Game")
 
+    def invalidate(self):
+        self.drawn_cells = None
+
     def refresh_background(self):
         self.screen.fill(self.background_color)
         self.draw_border()
 
-    def draw_border(self):
+    def draw_border(self, surface=None):
+        surface = surface or self.screen
         for x in range(self.grid_size + 1):
             for y in range(self.grid_size + 1):
                 if x == 0 or x == self.grid_size or y == 0 or y == self.grid_size:
                     rect = pygame.Rect(x * self.block_size, y * self.block_size, self.block_size, self.block_size)
-                    pygame.draw.rect(self.screen, Color.DARK_GRAY, rect)
+                    pygame.draw.rect(surface, Color.DARK_GRAY, rect)
+
+    def build_static_layer(self, static_blocks, teleports):
+        if self.static_layer is None:
+            self.static_layer = pygame.Surface(self.screen.get_size(), 0, self.screen)
+        layer = self.static_layer
+        layer.fill(self.background_color)
+        self.draw_border(layer)
+        for teleport in teleports:
+            teleport.draw(layer)
+        for block in static_blocks:
+            block.draw(layer)
+        self.invalidate()
 
     def draw_player(self, player):
         player.draw(self.screen)
@@ -47,43 +75,102 @@ class Screen:
             teleport.draw(self.screen)
 
     def draw_level_text(self, level, max_level):
-        level_font = pygame.font.SysFont("monospace", 25)
-        level_text = level_font.render(f"Level {level}/{max_level}", True, Color.GREEN)
+        level_text = render_text(f"Level {level}/{max_level}", 25, Color.GREEN)
         text_rect = level_text.get_rect(center=(self.width // 2, 35))
         self.screen.blit(level_text, text_rect)
 
+    def set_status(self, text, color=Color.RED):
+        status = (text, color) if text is not None else None
+        if status != self.status:
+            self.status = status
+            self.invalidate()
+
+    def draw_status(self):
+        if self.status is None:
+            return
+        status_text = render_text(self.status[0], 20, self.status[1])
+        self.screen.blit(status_text, status_text.get_rect(midright=(self.width - 10, 35)))
+
     def draw_instructions(self):
-        instructions = [
-            "WASD for movement",
-            "Z to undo movement",
-            "R to reset the level",
-            "ESC to return to menu"
-        ]
-        for i, instruction in enumerate(instructions):
-            instruction_text = self.font.render(instruction, True, Color.WHITE)
-            self.screen.blit(instruction_text, (10, 2 + i * 20))
-
-    def update_screen(self, player, key, door, blocks, teleports, level, max_level):
-        self.refresh_background()
-        self.draw_teleports(teleports)
-        self.draw_player(player)
-        self.draw_key(key)
-        self.draw_door(door)
-        self.draw_blocks(blocks)
+        # Two columns of four lines fit the top border row, left of the level text
+        columns = (
+            ("WASD move", "Z undo", "Y redo", "R reset"),
+            ("H hint", "F3 timings", "F4 dead ends", "ESC menu"),
+        )
+        x = 10
+        for lines in columns:
+            text = render_lines(lines, self.font_size, Color.WHITE, 18, self.font_type)
+            self.screen.blit(text, (x, 2))
+            x += text.get_width() + 20
+
+    def update_screen(self, player, key, door, blocks, level, max_level):
+        # Sprites that can move, in drawing order and grouped by the cell they sit on.
+        # Portals and immovable blocks live in the static layer.
+        sprites = [(sprite.image, sprite.rect.topleft) for sprite in (player, key, door, *blocks)]
+        cells = {}
+        for image, position in sprites:
+            cells.setdefault(position, []).append(image)
+
+        if self.drawn_cells is None or self.drawn_level != (level, max_level):
+            self.screen.blit(self.static_layer, (0, 0))
+            self.screen.blits(sprites, doreturn=False)
+            self.draw_level_text(level, max_level)
+            self.draw_instructions()
+            self.draw_status()
+            self.present()
+        else:
+            screen_rect = self.screen.get_rect()
+            dirty = []
+            for position in cells.keys() | self.drawn_cells.keys():
+                images = cells.get(position, [])
+                if images == self.drawn_cells.get(position, []):
+                    continue
+                rect = pygame.Rect(position, (self.block_size, self.block_size))
+                if rect.colliderect(screen_rect):
+                    self.redraw_cell(rect, images, level, max_level)
+                    dirty.append(rect)
+            if dirty:
+                self.present(dirty)
+        self.drawn_cells = cells
+        self.drawn_level = (level, max_level)
+
+    def present(self, rects=None):
+        start = time.perf_counter()
+        if rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
+        if self.profiler is not None:
+            self.profiler.span("present", start)
+
+    def draw_overlay(self, lines):
+        # Profiler readout over the bottom border row. The numbers change every frame, so the lines are
+        # rendered without the text cache.
+        rect = pygame.Rect(0, self.height - self.block_size, self.width, self.block_size)
+        self.screen.blit(self.static_layer, rect, rect)
+        font = get_font(self.font_size, self.font_type)
+        for i, line in enumerate(lines):
+            self.screen.blit(font.render(line, True, Color.GREEN), (10, rect.y + 4 + 18 * i))
+        pygame.display.update(rect)
+
+    def redraw_cell(self, rect, images, level, max_level):
+        # Repaint one cell in the same layer order as a full redraw, text overlays included
+        self.screen.set_clip(rect)
+        self.screen.blit(self.static_layer, rect, rect)
+        self.screen.blits([(image, rect.topleft) for image in images], doreturn=False)
         self.draw_level_text(level, max_level)
         self.draw_instructions()
-        pygame.display.update()
+        self.draw_status()
+        self.screen.set_clip(None)
 
-    def display_challenge_menu(self, current_index):
-        menu_font = pygame.font.SysFont("monospace", 40)
-        arrow_font = pygame.font.SysFont("monospace", 60)
-        header_font = pygame.font.SysFont("monospace", 35)
+    def display_challenge_menu(self, current_index, metrics=None, thumbnail=None):
+        self.invalidate()
         self.screen.fill(Color.BLACK)
 
-        left_arrow = arrow_font.render("<", True, Color.WHITE)
-        right_arrow = arrow_font.render(">", True, Color.WHITE)
-        challenge_name = menu_font.render(f"Level {current_index + 1}", True, Color.WHITE)
-        header_text = header_font.render("Replay individual levels", True, Color.WHITE)
+        left_arrow = render_text("<", 60, Color.WHITE)
+        right_arrow = render_text(">", 60, Color.WHITE)
+        challenge_name = render_text(f"Level {current_index + 1}", 40, Color.WHITE)
+        header_text = render_text("Replay individual levels", 35, Color.WHITE)
 
         left_rect = left_arrow.get_rect(center=(self.width // 4, self.height // 2))
         middle_rect = challenge_name.get_rect(center=(self.width // 2, self.height // 2))
@@ -95,15 +182,38 @@ class Screen:
         self.screen.blit(right_arrow, right_rect)
         self.screen.blit(header_text, header_rect)
 
+        if metrics is None:
+            details = ("Not measured yet",)
+        else:
+            if metrics["par"] is None:
+                par = "Par unknown"
+            elif metrics["par_optimal"]:
+                par = f"Par {metrics['par']} moves"
+            else:
+                # Shortest the solver found, without proof that nothing shorter exists
+                par = f"Best known {metrics['par']} moves"
+            rating = f"{metrics['rating']}/5" if metrics["rating"] is not None else "unknown"
+            details = (par, f"Difficulty {rating}")
+        for i, line in enumerate(details):
+            text = render_text(line, 25, Color.GRAY)
+            self.screen.blit(text, text.get_rect(center=(self.width // 2, self.height // 2 + 60 + 35 * i)))
+
+        # Preview from the thumbnail atlas: one blit of the level's area of the atlas image
+        if thumbnail is not None:
+            atlas, area = thumbnail
+            preview_rect = pygame.Rect((0, 0), area.size)
+            preview_rect.center = (self.width // 2, self.height // 2 + 210)
+            self.screen.blit(atlas, preview_rect, area)
+
         pygame.display.update()
         return left_rect, middle_rect, right_rect
 
-    def display_menu(self):
-        logging.info("Displaying menu")
-        menu_font = pygame.font.SysFont("monospace", 50)
-        start_text = menu_font.render("Start", True, Color.WHITE)
+    def display_menu(self, can_continue=False):
+        logger.info("Displaying menu")
+        self.invalidate()
+        start_text = render_text("Start", 50, Color.WHITE)
         start_rect = start_text.get_rect(center=(self.width // 2, self.height // 2 - 100))
-        challenge_text = menu_font.render("Levels", True, Color.WHITE)
+        challenge_text = render_text("Levels", 50, Color.WHITE)
         challenge_rect = challenge_text.get_rect(center=(self.width // 2, self.height // 2))
 
 
@@ -112,34 +222,33 @@ class Screen:
         self.screen.blit(challenge_text, challenge_rect)
 
         if sys.platform != "emscripten":
-            edit_text = menu_font.render("Editor", True, Color.WHITE)
+            edit_text = render_text("Editor", 50, Color.WHITE)
             edit_rect = edit_text.get_rect(center=(self.width // 2, self.height // 2 + 100))
             self.screen.blit(edit_text, edit_rect)
         else:
             edit_rect = None
 
         continue_rect = None
-        if sys.platform == "emscripten":
-            from js import window
-            saved_level = window.localStorage.getItem("current_level_index")
-            if saved_level is not None:
-                continue_text = menu_font.render("Continue", True, Color.WHITE)
-                continue_rect = continue_text.get_rect(center=(self.width // 2, self.height // 2 + 100))
-                self.screen.blit(continue_text, continue_rect)
+        if can_continue:
+            # Below the editor where there is one
+            offset = 100 if edit_rect is None else 200
+            continue_text = render_text("Continue", 50, Color.WHITE)
+            continue_rect = continue_text.get_rect(center=(self.width // 2, self.height // 2 + offset))
+            self.screen.blit(continue_text, continue_rect)
 
         pygame.display.update()
-        logging.debug("Menu displayed with Start, Continue (if available), and Edit options")
+        logger.debug("Menu displayed with Start, Continue (if available), and Edit options")
         return start_rect, edit_rect, continue_rect, challenge_rect
     
     def display_winning_screen(self, total_moves, total_undos, total_resets, elapsed_time):
-        logging.info("Displaying winning screen")
-        winning_font = pygame.font.SysFont("monospace", 50)
-        moves_text = winning_font.render(f"Total Moves: {total_moves}", True, Color.WHITE)
-        undos_text = winning_font.render(f"Total Undos: {total_undos}", True, Color.WHITE)
-        resets_text = winning_font.render(f"Total Resets: {total_resets}", True, Color.WHITE)
-        win_text = winning_font.render("You Win!", True, Color.GREEN)
-        return_text = winning_font.render("Return to Menu", True, Color.WHITE)
-        time_text = winning_font.render(f"Time: {int(elapsed_time)} seconds", True, Color.WHITE)
+        logger.info("Displaying winning screen")
+        self.invalidate()
+        moves_text = render_text(f"Total Moves: {total_moves}", 50, Color.WHITE)
+        undos_text = render_text(f"Total Undos: {total_undos}", 50, Color.WHITE)
+        resets_text = render_text(f"Total Resets: {total_resets}", 50, Color.WHITE)
+        win_text = render_text("You Win!", 50, Color.GREEN)
+        return_text = render_text("Return to Menu", 50, Color.WHITE)
+        time_text = render_text(f"Time: {int(elapsed_time)} seconds", 50, Color.WHITE)
 
         win_rect = win_text.get_rect(center=(self.width // 2, self.height // 2 - 200))
         time_rect = time_text.get_rect(center=(self.width // 2, self.height // 2 - 150))
@@ -156,5 +265,5 @@ class Screen:
         self.screen.blit(resets_text, resets_rect)
         self.screen.blit(return_text, return_rect)
         pygame.display.update()
-        logging.debug("Winning screen displayed with total moves, undos, resets, and elapsed time")
+        logger.debug("Winning screen displayed with total moves, undos, resets, and elapsed time")
         return return_rect
\ No newline at end of file
@@ -0,0 +1,504 @@
+from array import array
+from game.journal import DOOR_OPEN
+
+UP, DOWN, LEFT, RIGHT, UNDO = 0, 1, 2, 3, 4
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+ACTIONS = (UP, DOWN, LEFT, RIGHT, UNDO)
+
+PLAYER, KEY, DOOR = 0, 1, 2
+KEY_REMOVED = -1
+
+
+def cell_of(x, y, block_size, width):
+    return (y // block_size) * width + x // block_size
+
+
+class Board:
+    def __init__(self, grid_size, player_start, key_start, door_start, blocks, movable, teleports):
+        self.grid_size = grid_size
+        self.width = grid_size + 1
+        self.size = self.width * self.width
+        self.player_start = player_start
+        self.key_start = key_start
+        self.door_start = door_start
+        self.block_starts = tuple(blocks)
+        self.movable = tuple(movable)
+        self.teleports = tuple(teleports)
+        self.deltas = (-self.width, self.width, -1, 1)
+        # Both lookup tables carry a row of padding so that a cell one step off the board
+        # (negative indices wrap into it) reads as outside instead of raising.
+        self.interior = bytes(
+            1 if 0 < cell % self.width < grid_size and 0 < cell // self.width < grid_size else 0
+            for cell in range(self.size)
+        ) + bytes(self.width)
+        pads = bytearray(self.size + self.width)
+        for a, b in self.teleports:
+            pads[a] = 1
+            pads[b] = 1
+        self.pads = bytes(pads)
+
+    @classmethod
+    def from_level_data(cls, level_data, grid_size=10, block_size=80):
+        width = grid_size + 1
+        return cls(
+            grid_size,
+            cell_of(*level_data["player_start"], block_size, width),
+            cell_of(*level_data["key_start"], block_size, width),
+            cell_of(*level_data["door_start"], block_size, width),
+            [cell_of(block[0], block[1], block_size, width) for block in level_data["blocks"]],
+            [bool(block[4]) if len(block) > 4 else False for block in level_data["blocks"]],
+            [(cell_of(t[0][0], t[0][1], block_size, width), cell_of(t[1][0], t[1][1], block_size, width))
+             for t in level_data.get("teleports", [])],
+        )
+
+    @classmethod
+    def from_level(cls, level, grid_size=10, block_size=80):
+        width = grid_size + 1
+        return cls(
+            grid_size,
+            cell_of(*level.player_start, block_size, width),
+            cell_of(*level.key_start, block_size, width),
+            cell_of(*level.door_start, block_size, width),
+            [cell_of(block.rect.x, block.rect.y, block_size, width) for block in level.blocks],
+            [block.can_move for block in level.blocks],
+            [(cell_of(t.teleport1.rect.x, t.teleport1.rect.y, block_size, width),
+              cell_of(t.teleport2.rect.x, t.teleport2.rect.y, block_size, width)) for t in level.teleports],
+        )
+
+    def inside(self, cell):
+        return self.interior[cell] == 1
+
+    def position(self, cell, block_size=80):
+        if cell == KEY_REMOVED:
+            return (-100, -100)
+        return ((cell % self.width) * block_size, (cell // self.width) * block_size)
+
+
+class Simulation:
+    def __init__(self, board, journal=None, zobrist=None):
+        self.board = board
+        # Optional MoveJournal of undo transactions, for redo
+        self.journal = journal
+        # Optional ZobristKeys; self.hash then follows every move, undo and redo
+        self.zobrist = zobrist
+        self.hash = 0
+        self.touched = None
+        self.reset()
+
+    def reset(self):
+        board = self.board
+        self.player = board.player_start
+        self.key = board.key_start
+        self.door = board.door_start
+        self.door_open = False
+        self.blocks = list(board.block_starts)
+        # One movement stack per object: player, key, door, then every block in level order.
+        # They are game state, since how far undo reaches matters to the puzzle, so they are never
+        # cut short and grow by one entry per push for as long as the level is played.
+        self.history = [array('h') for _ in range(3 + len(self.blocks))]
+        self._index_blocks()
+        if self.zobrist is not None:
+            self.hash = self.zobrist.hash_state(self)
+        if self.journal is not None:
+            self.journal.clear()
+
+    def _index_blocks(self):
+        # Cell occupancy: how many blocks sit on each cell and the lowest block index among them,
+        # which is the block a scan of the block list in level order would find first.
+        interior = self.board.interior
+        size = self.board.size + self.board.width
+        self.counts = [0] * size
+        self.occupant = [-1] * size
+        for i in range(len(self.blocks) - 1, -1, -1):
+            cell = self.blocks[i]
+            self.counts[cell] += 1
+            self.occupant[cell] = i
+        # Cells holding more than one block and blocks off the interior, so undo can check
+        # every block without visiting the ones that have nothing to undo
+        self.stacked = sum(1 for count in self.counts if count > 1)
+        self.outside = sum(1 for cell in self.blocks if not interior[cell])
+        self.pushed = {i for i in range(len(self.blocks)) if self.history[3 + i]}
+        # Blocks moved since the last call to moved_blocks(), None when all of them may have
+        self.moved = None
+
+    def snapshot(self):
+        return (self.player, self.key, self.door, self.door_open, tuple(self.blocks), tuple(map(array.__copy__, self.history)))
+
+    def restore(self, snapshot):
+        self.player, self.key, self.door, self.door_open, blocks, history = snapshot
+        self.blocks = list(blocks)
+        self.history = list(map(array.__copy__, history))
+        self._index_blocks()
+        if self.zobrist is not None:
+            self.hash = self.zobrist.hash_state(self)
+
+    @property
+    def won(self):
+        return self.door_open and self.player == self.door
+
+    def get_position(self, obj):
+        if obj == PLAYER:
+            return self.player
+        if obj == KEY:
+            return self.key
+        if obj == DOOR:
+            return self.door
+        return self.blocks[obj - 3]
+
+    def set_position(self, obj, cell):
+        if obj == PLAYER:
+            self.player = cell
+        elif obj == KEY:
+            self.key = cell
+        elif obj == DOOR:
+            self.door = cell
+        else:
+            self.place_block(obj - 3, cell)
+
+    def place_block(self, i, cell):
+        counts = self.counts
+        interior = self.board.interior
+        old = self.blocks[i]
+        if self.touched is not None and i not in self.touched:
+            stack = self.history[3 + i]
+            self.touched[i] = (old, len(stack), stack[-1] if stack else 0)
+        counts[old] -= 1
+        if not counts[old]:
+            self.occupant[old] = -1
+        else:
+            if counts[old] == 1:
+                self.stacked -= 1
+            if self.occupant[old] == i:
+                self.occupant[old] = self.blocks.index(old, i + 1)
+        self.outside += (not interior[cell]) - (not interior[old])
+        self.blocks[i] = cell
+        counts[cell] += 1
+        if counts[cell] == 1:
+            self.occupant[cell] = i
+        else:
+            if counts[cell] == 2:
+                self.stacked += 1
+            if i < self.occupant[cell]:
+                self.occupant[cell] = i
+        if self.moved is not None:
+            self.moved.add(i)
+
+    def _blocks_at(self, cell):
+        if self.counts[cell] == 1:
+            return [self.occupant[cell]]
+        return [i for i in range(len(self.blocks)) if self.blocks[i] == cell]
+
+    def moved_blocks(self):
+        moved = range(len(self.blocks)) if self.moved is None else self.moved
+        self.moved = set()
+        return moved
+
+    def step(self, action):
+        if action == UNDO:
+            return self.undo()
+        return self.move(action)
+
+    def move(self, direction):
+        if self.journal is None and self.zobrist is None:
+            moved = self._move(self.board.deltas[direction])
+            if self.key == self.door:
+                self._settle()
+            return moved
+        before, door_open = self._track()
+        moved = self._move(self.board.deltas[direction])
+        if self.key == self.door:
+            self._settle()
+        if self.zobrist is not None:
+            self._rehash(before, door_open)
+        # Any change other than an undo leaves nothing to redo. A refused move can still have pushed
+        # something (the key before a blocked door), so compare instead of trusting the return value.
+        if self.journal is not None and \
+                (moved or self.touched or [b[0] for b in before] != [self.player, self.key, self.door]):
+            self.journal.clear()
+        self.touched = None
+        return moved
+
+    def _track(self):
+        # Cell, stack length and stack top of player, key and door before a change. Blocks report
+        # theirs to self.touched from place_block, the first time they are placed.
+        history = self.history
+        self.touched = {}
+        before = [(self.get_position(obj), len(history[obj]), history[obj][-1] if history[obj] else 0)
+                  for obj in (PLAYER, KEY, DOOR)]
+        return before, self.door_open
+
+    def _rehash(self, before, door_open):
+        zobrist = self.zobrist
+        history = self.history
+        h = self.hash
+        for obj, (old, length, top) in enumerate(before):
+            stack = history[obj]
+            h = zobrist.update(h, obj, old, top, self.get_position(obj), stack[-1] if stack else 0)
+        for i, (old, length, top) in self.touched.items():
+            stack = history[3 + i]
+            h = zobrist.update(h, 3 + i, old, top, self.blocks[i], stack[-1] if stack else 0)
+        if door_open != self.door_open:
+            h ^= zobrist.door_open
+        self.hash = h
+
+    def _move(self, d):
+        board = self.board
+        new = self.player + d
+        if not (board.interior[new] or (self.door_open and new == self.door)):
+            return False
+
+        counts = self.counts
+        if counts[new]:
+            # Blocks only share a cell after an undo through a teleport; push them in level order then
+            stacked = range(len(self.blocks)) if counts[new] > 1 else (self.occupant[new],)
+            for i in stacked:
+                if self.blocks[i] != new:
+                    continue
+                if not board.movable[i]:
+                    return False
+                target = new + d
+                if (board.interior[target] or (self.door_open and target == self.door)) and \
+                        target != self.key and target != self.door and not counts[target]:
+                    self.place_block(i, target)
+                    self.history[3 + i].append(d)
+                    self.pushed.add(i)
+                    self._teleport(3 + i, d, True, False)
+                else:
+                    return False
+
+        if self.key == new:
+            target = new + d
+            if ((board.interior[target] or (self.door_open and target == self.door)) and not counts[target]) or \
+                    target == self.door:
+                self.key = target
+                self.history[KEY].append(d)
+                self._teleport(KEY, d, False, False)
+            else:
+                return False
+
+        if not self.door_open and self.door == new:
+            target = new + d
+            if board.interior[target] and not counts[target]:
+                self.door = target
+                self.history[DOOR].append(d)
+                self._teleport(DOOR, d, False, False)
+            else:
+                return False
+
+        self.player = new
+        self.history[PLAYER].append(d)
+        self._teleport(PLAYER, d, True, False)
+        return True
+
+    def _object_at(self, cell, with_key_and_door, with_player):
+        # Same lookup order as the object lists handed to the teleports: blocks, key, door, player.
+        if self.counts[cell]:
+            return 3 + self.occupant[cell]
+        if with_key_and_door:
+            if self.key == cell:
+                return KEY
+            if self.door == cell:
+                return DOOR
+        if with_player and self.player == cell:
+            return PLAYER
+        return None
+
+    def _is_moveable(self, obj):
+        if obj == KEY or obj == DOOR:
+            return True
+        if obj >= 3:
+            return self.board.movable[obj - 3]
+        return False
+
+    def _teleport(self, obj, d, with_key_and_door, with_player):
+        board = self.board
+        if not board.teleports or not board.pads[self.get_position(obj)]:
+            return
+        for a, b in board.teleports:
+            position = self.get_position(obj)
+            if position == a:
+                self._jump(obj, b, d, with_key_and_door, with_player)
+            elif position == b:
+                self._jump(obj, a, d, with_key_and_door, with_player)
+
+    def _jump(self, obj, pad, d, with_key_and_door, with_player):
+        new = pad + d
+        hit = self._object_at(new, with_key_and_door, with_player)
+        if hit is None:
+            if self.board.inside(new):
+                self.set_position(obj, new)
+        elif obj == PLAYER and self._is_moveable(hit):
+            if hit == DOOR and self.door_open:
+                self.player = new
+                return
+            target = new + d
+            if self.board.inside(target) and self._object_at(target, with_key_and_door, with_player) is None:
+                self.set_position(hit, target)
+                self.history[hit].append(d)
+                if hit >= 3:
+                    self.pushed.add(hit - 3)
+                self.player = new
+
+    def _settle(self):
+        if self.key == self.door:
+            self.door_open = True
+            self.key = KEY_REMOVED
+
+    def undo_targets(self):
+        history = self.history
+        player = self.player - history[PLAYER][-1] if history[PLAYER] else self.player
+        if self.key == KEY_REMOVED:
+            key = KEY_REMOVED
+        else:
+            key = self.key - history[KEY][-1] if history[KEY] else self.key
+        door = self.door - history[DOOR][-1] if history[DOOR] else self.door
+        blocks = [block - history[3 + i][-1] if history[3 + i] else block for i, block in enumerate(self.blocks)]
+        return player, key, door, blocks
+
+    def can_undo(self):
+        board = self.board
+        interior = board.interior
+        counts = self.counts
+        if self.key == KEY_REMOVED:
+            return False
+        history = self.history
+        player = self.player - history[PLAYER][-1] if history[PLAYER] else self.player
+        key = self.key - history[KEY][-1] if history[KEY] else self.key
+        door = self.door - history[DOOR][-1] if history[DOOR] else self.door
+        if not (interior[player] and interior[key] and interior[door]):
+            return False
+
+        # Only blocks with something to undo move; the index covers the rest
+        changes = {}
+        outside = self.outside
+        for i in self.pushed:
+            cell = self.blocks[i]
+            target = cell - history[3 + i][-1]
+            if not interior[target]:
+                return False
+            outside -= not interior[cell]
+            changes[cell] = changes.get(cell, 0) - 1
+            changes[target] = changes.get(target, 0) + 1
+        if outside:
+            return False
+
+        if not (self._through_teleport(PLAYER, player) or
+                (player != key and player != door and not counts[player] + changes.get(player, 0))):
+            return False
+        if not (self._through_teleport(KEY, key) or not counts[key] + changes.get(key, 0)):
+            return False
+        if not (self._through_teleport(DOOR, door) or not counts[door] + changes.get(door, 0)):
+            return False
+
+        stacked = self.stacked
+        for cell, change in changes.items():
+            stacked -= counts[cell] > 1
+            stacked += counts[cell] + change > 1
+        return not stacked or \
+            all(self._through_teleport(3 + i, block) for i, block in enumerate(self.undo_targets()[3]))
+
+    def _through_teleport(self, obj, cell):
+        board = self.board
+        if not board.teleports or not board.pads[cell]:
+            return False
+        for a, b in board.teleports:
+            for pad, target in ((a, b), (b, a)):
+                if pad == cell and board.inside(target):
+                    if obj == KEY and self.door == target:
+                        return True
+                    if self._object_at(target, True, False) is None:
+                        return True
+        return False
+
+    def undo(self):
+        # Costs time in the player, key, door and every block with something to undo, not in the
+        # length of the stacks
+        if self.journal is None and self.zobrist is None:
+            return self._undo()
+        before, door_open = self._track()
+        undone = self._undo()
+        if undone and self.zobrist is not None:
+            self._rehash(before, door_open)
+        if undone and self.journal is not None:
+            journal = self.journal
+            journal.begin()
+            for obj, (old, length, top) in enumerate(before):
+                self._record(obj, old, length, top)
+            for i, (old, length, top) in self.touched.items():
+                self._record(3 + i, old, length, top)
+            if door_open != self.door_open:
+                journal.record(DOOR_OPEN, door_open, self.door_open, 0, 0, 0)
+            journal.rollback_empty()
+            journal.trim()
+        self.touched = None
+        return undone
+
+    def _record(self, obj, old, length, top):
+        stack = self.history[obj]
+        base = max(length - 1, 0)
+        cell = self.get_position(obj)
+        if cell != old or length or len(stack) > base:
+            self.journal.record(obj, old, cell, length, len(stack), top, stack[base:].tolist())
+
+    def redo(self):
+        # Take back the newest undo, exactly: positions, undo stacks and the door
+        if not self.journal:
+            return False
+        before, door_open = self._track()
+        for obj, old, new, length, new_length, top, pushed in self.journal.pop():
+            if obj == DOOR_OPEN:
+                self.door_open = bool(old)
+                continue
+            # Placed before its stack changes, so self.touched sees the stack top the undo left
+            self.set_position(obj, old)
+            stack = self.history[obj]
+            base = max(length - 1, 0)
+            del stack[base:]
+            if length > base:
+                stack.append(top)
+            if obj >= 3:
+                if stack:
+                    self.pushed.add(obj - 3)
+                else:
+                    self.pushed.discard(obj - 3)
+        if self.zobrist is not None:
+            self._rehash(before, door_open)
+        self.touched = None
+        return True
+
+    def _undo(self):
+        if not self.can_undo():
+            return False
+        history = self.history
+        deltas = [0, 0, 0]
+        for obj in (PLAYER, KEY, DOOR):
+            if history[obj]:
+                d = history[obj].pop()
+                self.set_position(obj, self.get_position(obj) - d)
+                deltas[obj] = -d
+        block_deltas = {}
+        for i in list(self.pushed):
+            d = history[3 + i][-1]
+            self.place_block(i, self.blocks[i] - d)
+            history[3 + i].pop()
+            block_deltas[i] = -d
+            if not history[3 + i]:
+                self.pushed.discard(i)
+        if not self.board.teleports:
+            self._settle()
+            return True
+        # Every object gets a teleport check afterwards, even ones that did not move.
+        self._teleport(PLAYER, deltas[PLAYER], True, True)
+        self._teleport(KEY, deltas[KEY], False, True)
+        self._teleport(DOOR, deltas[DOOR], False, True)
+        # Blocks only leave a pad through their own jump, so the ones on pads now are all that can teleport
+        on_pads = set()
+        for a, b in self.board.teleports:
+            if self.counts[a]:
+                on_pads.update(self._blocks_at(a))
+            if self.counts[b]:
+                on_pads.update(self._blocks_at(b))
+        for i in sorted(on_pads):
+            self._teleport(3 + i, block_deltas.get(i, 0), True, True)
+        self._settle()
+        return True
@@ -0,0 +1,296 @@
+import time
+import argparse
+from array import array
+from collections import deque
+from game.levels import create_levels_data, load_levels_data
+from game.simulation import Board, Simulation, ACTIONS, UNDO, PLAYER, KEY, DOOR
+
+# Keystrokes for the actions, in the order of game.simulation.ACTIONS
+ACTION_KEYS = "wsadz"
+
+# Undo stack entries the quick, merging search tells states apart by. Only used when asked for, and
+# as the first pass of the exact search.
+HEURISTIC_UNDO_DEPTH = 2
+DEFAULT_MAX_STATES = 2_000_000
+
+
+class SolveResult:
+    def __init__(self, status, moves, states, optimal, elapsed):
+        self.status = status
+        self.moves = moves
+        self.states = states
+        self.optimal = optimal
+        self.elapsed = elapsed
+
+    @property
+    def solved(self):
+        return self.status == "solved"
+
+    @property
+    def length(self):
+        return len(self.moves) if self.moves is not None else None
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "length": self.length,
+            "moves": self.moves,
+            "states": self.states,
+            "optimal": self.optimal,
+            "elapsed": round(self.elapsed, 4),
+        }
+
+
+class Solver:
+    # Breadth-first search where undo (Z) is one of the moves. Undo stacks grow with every move, so
+    # states that differ only deep in their stacks would never be merged and the search would not end.
+    #
+    # With undo_depth set, states are merged when the object cells and the top undo_depth entries of
+    # every stack agree. That is a heuristic: it finds real solutions fast, but not always the shortest,
+    # and running out of states proves nothing. When it runs out, it tries again one entry deeper.
+    #
+    # Without undo_depth (the default) the search is exact. The heuristic gives a solution of some length
+    # first; then a bounded search looks for anything shorter. Within h more moves no undo reads deeper
+    # than h entries, so a state with h moves left is told apart by its top h entries only, and a state
+    # seen earlier that agrees with it there can do everything it can. Only lengths that bounded search
+    # proves are reported as optimal, otherwise they are the best length found.
+
+    def __init__(self, board, undo_depth=None, max_states=DEFAULT_MAX_STATES, time_limit=None):
+        self.board = board
+        self.undo_depth = undo_depth
+        self.max_states = max_states
+        self.time_limit = time_limit
+        self.simulation = Simulation(board)
+        # Static blocks never move unless they sit on a teleport pad
+        self.dynamic_blocks = tuple(
+            i for i, cell in enumerate(board.block_starts) if board.movable[i] or board.pads[cell]
+        )
+        self.tracked = (PLAYER, KEY, DOOR) + tuple(3 + i for i in self.dynamic_blocks)
+        # Movement deltas shifted to 1..2 * width + 1 so that 0 can pad short stacks and end whole ones,
+        # and the value after them ends stacks cut short
+        self.offset = board.width + 1
+        self.cut = 2 * board.width + 2
+        self.wide = board.size + 1 > 255 or self.cut > 255
+
+    def encode(self, snapshot, depth=HEURISTIC_UNDO_DEPTH):
+        # Merging key: cells plus the top depth entries of every stack, None keeps whole stacks
+        player, key, door, door_open, blocks, history = snapshot
+        values = [player, key + 1, door, door_open]
+        values += [blocks[i] for i in self.dynamic_blocks]
+        offset = self.offset
+        for obj in self.tracked:
+            stack = history[obj]
+            if depth is None:
+                values += [d + offset for d in stack]
+                values.append(0)
+            elif depth:
+                if len(stack) < depth:
+                    values += [0] * (depth - len(stack))
+                    values += [d + offset for d in stack]
+                else:
+                    values += [d + offset for d in stack[-depth:]]
+        return self._pack(values)
+
+    def encode_horizon(self, snapshot, horizon):
+        # Exact key for a state with horizon moves left: stacks up to that long whole, longer ones
+        # as their top horizon entries and a mark that more lies below
+        player, key, door, door_open, blocks, history = snapshot
+        values = [player, key + 1, door, door_open]
+        values += [blocks[i] for i in self.dynamic_blocks]
+        offset = self.offset
+        for obj in self.tracked:
+            stack = history[obj]
+            if len(stack) <= horizon:
+                values += [d + offset for d in stack]
+                values.append(0)
+            else:
+                values += [d + offset for d in stack[len(stack) - horizon:]]
+                values.append(self.cut)
+        return self._pack(values)
+
+    def _pack(self, values):
+        if self.wide:
+            return array('H', values).tobytes()
+        return bytes(values)
+
+    def solve(self):
+        start_time = time.perf_counter()
+        deadline = start_time + self.time_limit if self.time_limit else None
+        depth = self.undo_depth or HEURISTIC_UNDO_DEPTH
+        states = 0
+        while True:
+            status, moves, explored = self.search_merged(depth, deadline, self.max_states - states)
+            states += explored
+            # Ran out of states after merging some that differ deeper down: tell one more entry apart
+            if status != "merged" or states >= self.max_states:
+                break
+            depth += 1
+        if status == "exhausted":
+            # Nothing was merged away, so nothing is reachable that wins
+            return SolveResult("unsolvable", None, states, False, time.perf_counter() - start_time)
+        if self.undo_depth is not None:
+            if status == "merged":
+                status = "unknown"
+            # Merged states only ever differ in entries that a solution this short cannot reach
+            optimal = moves is not None and len(moves) <= depth
+            return SolveResult(status, moves, states, optimal, time.perf_counter() - start_time)
+        if status == "timeout":
+            return SolveResult("timeout", None, states, False, time.perf_counter() - start_time)
+
+        # Exact: anything shorter than the heuristic's solution, or any solution at all without one
+        bound = len(moves) - 1 if moves is not None else None
+        if moves is not None and len(moves) <= depth:
+            return SolveResult("solved", moves, states, True, time.perf_counter() - start_time)
+        exact, shorter, explored = self.search_bounded(bound, deadline, max(self.max_states - states, 0))
+        states += explored
+        elapsed = time.perf_counter() - start_time
+        if shorter is not None:
+            return SolveResult("solved", shorter, states, True, elapsed)
+        if moves is not None:
+            return SolveResult("solved", moves, states, exact == "exhausted", elapsed)
+        if exact == "exhausted":
+            return SolveResult("unsolvable", None, states, False, elapsed)
+        return SolveResult("unknown" if exact == "limit" else exact, None, states, False, elapsed)
+
+    def search_merged(self, depth, deadline, max_states):
+        # (status, moves, states) with status "solved", "exhausted", "merged", "limit" or "timeout".
+        # "merged" ran out of states after merging one whose stacks may reach past depth, "exhausted"
+        # never did and is exact.
+        simulation = self.simulation
+        simulation.reset()
+        start = simulation.snapshot()
+        start_key = self.encode(start, depth)
+        parents = {start_key: None}
+        queue = deque([(start, start_key)])
+        expanded = 0
+        merged = False
+
+        while queue:
+            expanded += 1
+            if deadline and expanded % 1024 == 0 and time.perf_counter() > deadline:
+                return "timeout", None, len(parents)
+            snapshot, key = queue.popleft()
+            dirty = True
+            for action in ACTIONS:
+                if dirty:
+                    simulation.restore(snapshot)
+                changed = simulation.step(action)
+                if not changed and action == UNDO:
+                    dirty = False
+                    continue
+                child = simulation.snapshot()
+                if not changed and child == snapshot:
+                    dirty = False
+                    continue
+                dirty = True
+                child_key = self.encode(child, depth)
+                if child_key in parents:
+                    if not merged:
+                        merged = any(len(child[5][obj]) >= depth for obj in self.tracked)
+                    continue
+                parents[child_key] = (key, action)
+                if simulation.won:
+                    return "solved", self._path(parents, child_key), len(parents)
+                if len(parents) >= max_states:
+                    return "limit", None, len(parents)
+                queue.append((child, child_key))
+        return ("merged" if merged else "exhausted"), None, len(parents)
+
+    def search_bounded(self, bound, deadline, max_states):
+        # Exact search for solutions of at most bound moves, any length when bound is None.
+        # (status, moves, states), "exhausted" proves there is none.
+        simulation = self.simulation
+        simulation.reset()
+        start = simulation.snapshot()
+        unbounded = bound is None
+        start_key = self.encode(start, None) if unbounded else self.encode_horizon(start, bound)
+        parents = {start_key: None}
+        layer = [(start, start_key)]
+        length = 0
+        expanded = 0
+        while layer and (unbounded or length < bound):
+            length += 1
+            horizon = None if unbounded else bound - length
+            next_layer = []
+            for snapshot, key in layer:
+                expanded += 1
+                if deadline and expanded % 1024 == 0 and time.perf_counter() > deadline:
+                    return "timeout", None, len(parents)
+                dirty = True
+                for action in ACTIONS:
+                    if dirty:
+                        simulation.restore(snapshot)
+                    changed = simulation.step(action)
+                    if not changed and action == UNDO:
+                        dirty = False
+                        continue
+                    child = simulation.snapshot()
+                    if not changed and child == snapshot:
+                        dirty = False
+                        continue
+                    dirty = True
+                    if simulation.won:
+                        return "solved", self._path(parents, key) + ACTION_KEYS[action], len(parents)
+                    if unbounded:
+                        child_key = self.encode(child, None)
+                        if child_key in parents:
+                            continue
+                    else:
+                        if not horizon:
+                            continue
+                        # States seen before with at least as many moves left, agreeing on the entries
+                        # those moves could reach
+                        longest = min(max(horizon, *(len(child[5][obj]) for obj in self.tracked)), bound)
+                        if any(self.encode_horizon(child, reach) in parents for reach in range(horizon, longest + 1)):
+                            continue
+                        child_key = self.encode_horizon(child, horizon)
+                    parents[child_key] = (key, action)
+                    if len(parents) >= max_states:
+                        return "limit", None, len(parents)
+                    next_layer.append((child, child_key))
+            layer = next_layer
+        return "exhausted", None, len(parents)
+
+    def _path(self, parents, key):
+        actions = []
+        while parents[key] is not None:
+            key, action = parents[key]
+            actions.append(ACTION_KEYS[action])
+        return "".join(reversed(actions))
+
+
+def solve_level(level_data, undo_depth=None, max_states=DEFAULT_MAX_STATES, time_limit=None):
+    return Solver(Board.from_level_data(level_data), undo_depth, max_states, time_limit).solve()
+
+
+def replay(level_data, moves):
+    simulation = Simulation(Board.from_level_data(level_data))
+    for move in moves:
+        simulation.step(ACTION_KEYS.index(move))
+    return simulation.won
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find shortest solutions for puzzle levels")
+    parser.add_argument("levels", nargs="?", help="levels file, defaults to data/levels.json")
+    parser.add_argument("--level", type=int, action="append", help="1-based level number, can be repeated")
+    parser.add_argument("--undo-depth", type=int,
+                        help="merge states on this many undo stack entries: faster, but neither shortest nor "
+                             "proof of anything; exact search without it")
+    parser.add_argument("--max-states", type=int, default=DEFAULT_MAX_STATES)
+    parser.add_argument("--timeout", type=float, help="seconds per level")
+    args = parser.parse_args()
+
+    levels = load_levels_data(args.levels) if args.levels else create_levels_data("../data/levels.json")
+    numbers = args.level or range(1, len(levels) + 1)
+    for number in numbers:
+        result = solve_level(levels[number - 1], args.undo_depth, args.max_states, args.timeout)
+        if result.solved:
+            length = f"{result.length} moves" + ("" if result.optimal else " (best found, not proven shortest)")
+        else:
+            length = result.status
+        print(f"Level {number}: {length}, {result.states} states, {result.elapsed:.2f}s {result.moves or ''}".rstrip())
+
+
+if __name__ == "__main__":
+    main()
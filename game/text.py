@@ -0,0 +1,24 @@
+import pygame
+from functools import lru_cache
+
+DEFAULT_FONT = "monospace"
+
+# SysFont scans the system font list on every call, so each (name, size) is looked up once
+@lru_cache(maxsize=None)
+def get_font(size, name=DEFAULT_FONT):
+    return pygame.font.SysFont(name, size)
+
+# Rendered surfaces are shared between callers, blit them but do not draw on them
+@lru_cache(maxsize=256)
+def render_text(text, size, color, name=DEFAULT_FONT, antialias=True):
+    return get_font(size, name).render(text, antialias, color)
+
+@lru_cache(maxsize=32)
+def render_lines(lines, size, color, line_height, name=DEFAULT_FONT):
+    rendered = [render_text(line, size, color, name) for line in lines]
+    width = max(text.get_width() for text in rendered)
+    height = line_height * (len(rendered) - 1) + rendered[-1].get_height()
+    surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    for i, text in enumerate(rendered):
+        surface.blit(text, (0, i * line_height))
+    return surface
@@ -0,0 +1,17 @@
+import pygame
+
+# Scaled and display-converted surfaces shared by all entities, keyed by (path, size, variant)
+_textures = {}
+
+def load_texture(path, size, variant="alpha"):
+    key = (path, tuple(size), variant)
+    texture = _textures.get(key)
+    if texture is not None:
+        return texture
+    texture = pygame.transform.scale(pygame.image.load(path), size)
+    # convert() needs a display mode; without one keep the plain surface and do not cache it
+    if pygame.display.get_surface() is None:
+        return texture
+    texture = texture.convert() if variant == "opaque" else texture.convert_alpha()
+    _textures[key] = texture
+    return texture
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import pygame
+from game.color import Color
+from game.levels import LevelRepository, level_hash, levels_file
+from game.levelstore import LevelStore
+
+logger = logging.getLogger(__name__)
+
+ATLAS_VERSION = 2
+# Pixels per grid cell in a thumbnail, an 11x11 level becomes 176x176
+CELL = 16
+# Slots per atlas page; a page is its own image file and the menu loads only the pages it shows
+COLUMNS = 4
+ROWS = 4
+PAGE_SLOTS = COLUMNS * ROWS
+# Pages the menu keeps loaded, the least recently shown is dropped first
+CACHED_PAGES = 4
+LEVEL_BLOCK_SIZE = 80
+GRID_SIZE = 10
+TEXTURES = {
+    "block": "assets/pixel_block.png",
+    "block_moveable": "assets/pixel_block_moveable.png",
+    "portal": "assets/pixel_portal.png",
+    "player": "assets/pixel_player.png",
+    "key": "assets/pixel_key.png",
+    "door": "assets/pixel_door_closed.png",
+}
+
+
+def thumbnails_file(levels_path):
+    # Common prefix of the atlas files: the slot index with a .json suffix, pages with .<page>.png
+    return levels_path + ".thumbs"
+
+
+class ThumbnailRenderer:
+    # Draws levels straight from their data at thumbnail scale, without entities or a display mode
+    def __init__(self, cell=CELL, grid_size=GRID_SIZE):
+        self.cell = cell
+        self.grid_size = grid_size
+        self.size = cell * (grid_size + 1)
+        self.images = {name: pygame.transform.smoothscale(pygame.image.load(path), (cell, cell))
+                       for name, path in TEXTURES.items()}
+
+    def cell_position(self, position):
+        return position[0] // LEVEL_BLOCK_SIZE * self.cell, position[1] // LEVEL_BLOCK_SIZE * self.cell
+
+    def render(self, level_data):
+        surface = pygame.Surface((self.size, self.size))
+        surface.fill(Color.BLACK)
+        last = self.grid_size * self.cell
+        for i in range(self.grid_size + 1):
+            for rect in ((i * self.cell, 0), (i * self.cell, last), (0, i * self.cell), (last, i * self.cell)):
+                surface.fill(Color.DARK_GRAY, pygame.Rect(rect, (self.cell, self.cell)))
+        sprites = []
+        for pair in level_data.get("teleports", []):
+            sprites += [(self.images["portal"], self.cell_position(end)) for end in pair]
+        for block in level_data["blocks"]:
+            can_move = len(block) > 4 and block[4]
+            sprites.append((self.images["block_moveable" if can_move else "block"], self.cell_position(block)))
+        # Same drawing order as a level frame
+        for name in ("player", "key", "door"):
+            sprites.append((self.images[name], self.cell_position(level_data[f"{name}_start"])))
+        surface.blits(sprites, doreturn=False)
+        return surface
+
+
+class ThumbnailAtlas:
+    # Level previews in fixed-size page images on disk, with a slot per level content hash in a JSON index.
+    # A background thread reads the levels itself, hashes them and renders missing previews page by page,
+    # then swaps in the new index in a single assignment. The menu loads a page when it first shows a level
+    # on it and keeps only a few, so neither startup nor memory grows with the number of levels. Edited
+    # levels get new hashes and only they are rendered again; slots of levels that are gone are reused.
+    def __init__(self, file_path, cell=CELL):
+        self.file_path = file_path
+        self.index_path = file_path + ".json"
+        self.cell = cell
+        self.size = cell * (GRID_SIZE + 1)
+        # {hash: slot} replaced as a whole by the worker
+        self.slots = {}
+        # Rewrites of every page in this run, a cached page older than that is loaded again
+        self.versions = {}
+        self.generation = 0
+        # {page: (version, surface)} in the order pages were last used
+        self.pages = {}
+        # File stats of the levels the last pass read, a pass only starts when they change
+        self.source = None
+        self.worker = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError) as error:
+            if not isinstance(error, FileNotFoundError):
+                logger.warning("Ignoring unreadable thumbnail index %s: %s", self.index_path, error)
+            return
+        if index.get("version") != ATLAS_VERSION or index.get("cell") != self.cell:
+            return
+        self.slots = index["slots"]
+        self.generation += 1
+
+    def page_path(self, page):
+        return f"{self.file_path}.{page}.png"
+
+    def slot_rect(self, slot):
+        slot %= PAGE_SLOTS
+        return pygame.Rect(slot % COLUMNS * self.size, slot // COLUMNS * self.size, self.size, self.size)
+
+    def get(self, content_hash):
+        # (surface, area) to blit the preview from, or None until it is rendered
+        slot = self.slots.get(content_hash)
+        if slot is None:
+            return None
+        page = slot // PAGE_SLOTS
+        version = self.versions.get(page, 0)
+        cached = self.pages.pop(page, None)
+        if cached is None or cached[0] != version:
+            try:
+                surface = pygame.image.load(self.page_path(page))
+            except (FileNotFoundError, pygame.error) as error:
+                logger.warning("Could not load thumbnail page %s: %s", self.page_path(page), error)
+                return None
+            # Display format blits faster; converting needs the display, so it happens here on the main thread
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            cached = (version, surface)
+        self.pages[page] = cached
+        while len(self.pages) > CACHED_PAGES:
+            del self.pages[next(iter(self.pages))]
+        return cached[1], self.slot_rect(slot)
+
+    def missing(self, hashes):
+        slots = self.slots
+        return [content_hash for content_hash in dict.fromkeys(hashes) if content_hash not in slots]
+
+    def update(self, levels_path, background=True):
+        # Renders previews of levels not in the atlas yet, off the main loop unless background is False.
+        # Here only the file stats of the levels are compared; reading and hashing them is the worker's.
+        # The browser build has no threads and renders in place.
+        with self.lock:
+            if self.worker is not None and self.worker.is_alive():
+                return False
+            source = self.source_stats(levels_path)
+            if source == self.source:
+                return False
+            self.source = source
+            if background and sys.platform != "emscripten":
+                self.worker = threading.Thread(target=self.build_from, args=(levels_path,),
+                                               name="thumbnail-renderer", daemon=True)
+                self.worker.start()
+            else:
+                self.build_from(levels_path)
+            return True
+
+    def source_stats(self, levels_path):
+        try:
+            stat = os.stat(levels_path)
+            levels = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            levels = None
+        return levels, LevelStore(levels_path).journal_stat()
+
+    def build_from(self, levels_path):
+        levels = LevelRepository(levels_path)
+        levels_data = [levels.data(i) for i in range(len(levels))]
+        if self.missing(level_hash(level_data) for level_data in levels_data):
+            self.build(levels_data)
+
+    def wait(self):
+        worker = self.worker
+        if worker is not None:
+            worker.join()
+
+    def build(self, levels_data):
+        start = time.perf_counter()
+        by_hash = {level_hash(level_data): level_data for level_data in levels_data}
+        slots = {content_hash: slot for content_hash, slot in self.slots.items() if content_hash in by_hash}
+        missing = [content_hash for content_hash in by_hash if content_hash not in slots]
+        free = sorted(set(range(len(slots) + len(missing))) - set(slots.values()))
+        slots.update(zip(missing, free))
+        pages = {}
+        for content_hash in missing:
+            pages.setdefault(slots[content_hash] // PAGE_SLOTS, []).append(content_hash)
+        renderer = ThumbnailRenderer(self.cell)
+        try:
+            # One page in memory at a time, each written before the index that points into it
+            for page, hashes in sorted(pages.items()):
+                surface = self.read_page(page)
+                surface.blits([(renderer.render(by_hash[content_hash]), self.slot_rect(slots[content_hash]))
+                               for content_hash in hashes], doreturn=False)
+                self.save_page(page, surface)
+            self.save_index(slots)
+            self.remove_pages_after(max(slots.values(), default=-1) // PAGE_SLOTS)
+        except (OSError, pygame.error) as error:
+            logger.error("Could not save the thumbnail atlas to %s: %s", self.file_path, error)
+            return []
+        versions = dict(self.versions)
+        for page in pages:
+            versions[page] = versions.get(page, 0) + 1
+        self.versions = versions
+        self.slots = slots
+        self.generation += 1
+        logger.info("Rendered %d level thumbnails in %.3fs", len(missing), time.perf_counter() - start)
+        return missing
+
+    def read_page(self, page):
+        try:
+            return pygame.image.load(self.page_path(page))
+        except (FileNotFoundError, pygame.error):
+            surface = pygame.Surface((COLUMNS * self.size, ROWS * self.size))
+            surface.fill(Color.BLACK)
+            return surface
+
+    def save_page(self, page, surface):
+        # Through a temporary file and an atomic rename, the menu may be loading the page meanwhile
+        temporary = self.page_path(page) + ".tmp"
+        with open(temporary, 'wb') as f:
+            pygame.image.save(surface, f, "png")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.page_path(page))
+
+    def save_index(self, slots):
+        temporary = self.index_path + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump({"version": ATLAS_VERSION, "cell": self.cell, "columns": COLUMNS, "rows": ROWS,
+                       "slots": slots}, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.index_path)
+
+    def remove_pages_after(self, last):
+        page = last + 1
+        while os.path.exists(self.page_path(page)):
+            os.remove(self.page_path(page))
+            page += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the level thumbnail atlas the Levels menu shows")
+    parser.add_argument("levels", nargs="?", help="levels file, defaults to data/levels.json")
+    args = parser.parse_args()
+
+    levels_path = args.levels or levels_file("../data/levels.json")
+    levels = LevelRepository(levels_path)
+    atlas = ThumbnailAtlas(thumbnails_file(levels_path))
+    start = time.perf_counter()
+    missing = atlas.build([levels.data(i) for i in range(len(levels))])
+    print(f"Rendered {len(missing)} of {len(levels)} thumbnails in {time.perf_counter() - start:.2f}s, "
+          f"atlas at {atlas.index_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
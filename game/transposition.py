@@ -0,0 +1,95 @@
+from array import array
+
+ALWAYS, DEPTH, TWO_TIER = "always", "depth", "two-tier"
+POLICIES = (ALWAYS, DEPTH, TWO_TIER)
+DEFAULT_SIZE_BITS = 16
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the low bits of a 64-bit state hash. The full hash is kept to
+    # tell colliding states apart, and when two states compete for a slot the policy picks the survivor:
+    #   always    the newest entry wins
+    #   depth     the entry with the larger depth (more search work behind it) wins, ties go to the newest
+    #   two-tier  every index has a depth-preferred slot and an always-replace slot; an entry pushed out
+    #             of the first drops into the second
+    # Values can be anything but None, which marks an empty slot.
+    def __init__(self, size_bits=DEFAULT_SIZE_BITS, policy=DEPTH):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown replacement policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.mask = (1 << size_bits) - 1
+        self.ways = 2 if policy == TWO_TIER else 1
+        slots = (1 << size_bits) * self.ways
+        self.hashes = array('Q', bytes(8 * slots))
+        self.depths = array('i', bytes(4 * slots))
+        self.values = [None] * slots
+        self.filled = 0
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return self.filled
+
+    def __contains__(self, h):
+        return self._find(h) is not None
+
+    def capacity(self):
+        return len(self.values)
+
+    def clear(self):
+        slots = len(self.values)
+        self.hashes = array('Q', bytes(8 * slots))
+        self.depths = array('i', bytes(4 * slots))
+        self.values = [None] * slots
+        self.filled = self.hits = self.misses = self.replaced = self.rejected = 0
+
+    def _find(self, h):
+        slot = (h & self.mask) * self.ways
+        for slot in range(slot, slot + self.ways):
+            if self.values[slot] is not None and self.hashes[slot] == h:
+                return slot
+        return None
+
+    def get(self, h, default=None):
+        slot = self._find(h)
+        if slot is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.values[slot]
+
+    def depth(self, h):
+        slot = self._find(h)
+        return None if slot is None else self.depths[slot]
+
+    def store(self, h, value, depth=0):
+        # Returns False when the policy kept the entry already in the slot
+        slot = self._find(h)
+        if slot is not None:
+            self._put(slot, h, value, depth)
+            return True
+        slot = (h & self.mask) * self.ways
+        if self.policy == DEPTH and self.values[slot] is not None and depth < self.depths[slot]:
+            self.rejected += 1
+            return False
+        if self.policy == TWO_TIER and self.values[slot] is not None:
+            if depth < self.depths[slot]:
+                slot += 1
+            else:
+                # The depth-preferred entry moves down to the always-replace slot
+                self._put(slot + 1, self.hashes[slot], self.values[slot], self.depths[slot])
+                self.values[slot] = None
+                self.filled -= 1
+        self._put(slot, h, value, depth)
+        return True
+
+    def _put(self, slot, h, value, depth):
+        if self.values[slot] is None:
+            self.filled += 1
+        elif self.hashes[slot] != h:
+            self.replaced += 1
+        self.hashes[slot] = h
+        self.values[slot] = value
+        self.depths[slot] = depth
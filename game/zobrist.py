@@ -0,0 +1,60 @@
+import random
+from array import array
+
+DEFAULT_SEED = 0x5EED
+
+
+class ZobristKeys:
+    # Random 64-bit keys for every (object, cell), the door-open flag and, with stack_tops, every
+    # (object, top of its undo stack). A state's hash is the XOR of the keys it holds, so a move only
+    # XORs out what changed and XORs in the replacement. Objects are numbered as in game.simulation.
+    # Searches that tell states apart by more of each stack ask for stack_depth entries from the top,
+    # keyed by how far down they sit, plus a mark for stacks that go on below them.
+    def __init__(self, board, stack_tops=False, seed=DEFAULT_SEED, stack_depth=1):
+        rng = random.Random(seed)
+        self.objects = 3 + len(board.block_starts)
+        self.width = board.width
+        self.stack_tops = stack_tops
+        # Cells run from KEY_REMOVED (-1) to the padding row, so they are stored shifted by one
+        self.cells = board.size + board.width + 1
+        self.positions = array('Q', (rng.getrandbits(64) for _ in range(self.objects * self.cells)))
+        # Stack tops are movement deltas (-width..width) or 0 for an empty stack, shifted by width
+        self.tops_per_object = 2 * board.width + 1
+        self.tops = array('Q', (rng.getrandbits(64) for _ in range(self.objects * self.tops_per_object)))
+        self.door_open = rng.getrandbits(64)
+        # Entries below the top, drawn after the keys above so those stay the same for every stack_depth
+        self.stack_depth = stack_depth
+        self.tops.extend(rng.getrandbits(64) for _ in range((stack_depth - 1) * self.objects * self.tops_per_object))
+        self.deeper = array('Q', (rng.getrandbits(64) for _ in range(self.objects)))
+
+    def position(self, obj, cell):
+        return self.positions[obj * self.cells + cell + 1]
+
+    def top(self, obj, top, level=0):
+        # level counts down from the top entry, which is level 0
+        return self.tops[(level * self.objects + obj) * self.tops_per_object + top + self.width]
+
+    def stack(self, obj, entries, deeper):
+        # Key of the top entries of a stack, bottom first as stacks are stored, at most stack_depth of them
+        h = self.deeper[obj] if deeper else 0
+        level = len(entries)
+        for d in entries:
+            level -= 1
+            h ^= self.top(obj, d, level)
+        return h
+
+    def update(self, h, obj, old, old_top, new, new_top):
+        if old != new:
+            h ^= self.position(obj, old) ^ self.position(obj, new)
+        if self.stack_tops and old_top != new_top:
+            h ^= self.top(obj, old_top) ^ self.top(obj, new_top)
+        return h
+
+    def hash_state(self, simulation):
+        h = self.door_open if simulation.door_open else 0
+        for obj in range(self.objects):
+            h ^= self.position(obj, simulation.get_position(obj))
+            if self.stack_tops:
+                stack = simulation.history[obj]
+                h ^= self.top(obj, stack[-1] if stack else 0)
+        return h
@@ -1,9 +1,38 @@
+import os
 import asyncio
+import argparse
 from game.game import Game
+from game.replay import ReplayRecorder
+from game.logs import configure_logging, parse_levels, DEFAULT_LEVEL
+from game.scheduler import DEFAULT_FPS
 
 def main():
-    game = Game()
+    parser = argparse.ArgumentParser(description="Puzzle Game")
+    parser.add_argument("--levels", metavar="FILE", help="levels file or pack to play, defaults to data/levels.json")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="frame rate cap, 0 for uncapped")
+    parser.add_argument("--record", metavar="FILE", help="record every input to a replay file")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile level frames and write them on exit, as a Chrome trace for .json files, CSV otherwise")
+    parser.add_argument("--dead-ends", action="store_true", help="start with the dead end indicator on (F4)")
+    parser.add_argument("--log-level", default=DEFAULT_LEVEL, help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--log", action="append", metavar="SUBSYSTEM=LEVEL",
+                        help="level for one module, e.g. leveleditor=DEBUG, can be repeated")
+    args, _ = parser.parse_known_args()
+    configure_logging(args.log_level, parse_levels(args.log))
+    if args.levels:
+        game = Game(fps=args.fps, levels_path=os.path.abspath(args.levels))
+    else:
+        game = Game(fps=args.fps)
+    if args.record:
+        game.recorder = ReplayRecorder()
+    game.profiler.enabled = bool(args.profile)
+    game.dead_states.enabled = args.dead_ends
     asyncio.run(game.run())
+    game.session.close()
+    if args.record:
+        game.save_recording(args.record)
+    if args.profile:
+        game.profiler.export(args.profile)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,24 @@
+import sys
+import json
+import argparse
+from game.levels import LevelRepository, levels_file
+from game.replay import run_replay
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run recorded games headless and check their final states")
+    parser.add_argument("replays", nargs="+", help="replay files written by main.py --record")
+    parser.add_argument("--levels", help="levels file the games were played on, defaults to data/levels.json")
+    args = parser.parse_args()
+
+    levels = LevelRepository(args.levels or levels_file("../data/levels.json"))
+    failed = 0
+    for file_path in args.replays:
+        with open(file_path, 'rb') as f:
+            result = run_replay(f.read(), levels)
+        failed += not result.ok
+        print(json.dumps({"replay": file_path, **result.to_dict()}), flush=True)
+    print(f"{len(args.replays) - failed}/{len(args.replays)} replays match", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
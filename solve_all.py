@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from game.levels import create_levels_data, load_levels_data
+from game.solver import solve_level, DEFAULT_MAX_STATES
+
+def solve_one(number, level_data, undo_depth, max_states, timeout):
+    result = solve_level(level_data, undo_depth, max_states, timeout)
+    record = {"level": number}
+    if result.solved:
+        record["solvable"] = True
+    elif result.status == "unsolvable":
+        record["solvable"] = False
+    else:
+        # Search ran out of time or states before it could tell
+        record["solvable"] = None
+    record.update(result.to_dict())
+    return record
+
+def solve_all(levels, numbers, workers, undo_depth, max_states, timeout):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(solve_one, number, levels[number - 1], undo_depth, max_states, timeout)
+                   for number in numbers]
+        for future in as_completed(futures):
+            yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve every level of a level pack in parallel")
+    parser.add_argument("levels", nargs="?", help="levels file, defaults to data/levels.json")
+    parser.add_argument("--level", type=int, action="append", help="1-based level number, can be repeated")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per level, 0 for no limit")
+    parser.add_argument("--undo-depth", type=int,
+                        help="merge states on this many undo stack entries: faster, but neither shortest nor "
+                             "proof of anything; exact search without it")
+    parser.add_argument("--max-states", type=int, default=DEFAULT_MAX_STATES)
+    args = parser.parse_args()
+
+    levels = load_levels_data(args.levels) if args.levels else create_levels_data("../data/levels.json")
+    numbers = args.level or range(1, len(levels) + 1)
+
+    start = time.perf_counter()
+    solved = 0
+    for record in solve_all(levels, numbers, args.workers, args.undo_depth, args.max_states, args.timeout or None):
+        solved += record["solvable"] is True
+        print(json.dumps(record), flush=True)
+    print(f"{solved}/{len(numbers)} levels solved in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()